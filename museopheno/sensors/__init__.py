@@ -98,9 +98,9 @@ class SensorManager:
         if self._check_index_exists(index_name):
             return self.available_indices[index_name]
 
-    def SmoothSignal(self,input_dates,output_dates=False,fmt='%Y%m%d'):
+    def SmoothSignal(self,input_dates,output_dates=False,fmt='%Y%m%d',**params):
         from museopheno.time_series import SmoothSignal
-        return SmoothSignal(dates=input_dates,output_dates=output_dates, bands_order=self.bands_order, fmt=fmt)
+        return SmoothSignal(dates=input_dates,output_dates=output_dates, bands_order=self.bands_order, fmt=fmt, **params)
     
     def add_index(self, index_name, expression,
                  condition=False, compulsory=True):
@@ -73,10 +73,155 @@ def cost_function(params, time_samples, samples):
 def cost_function_grad(params, time_samples, samples):
     """
     """
-    f = double_logistique(params, time_samples)
-    df = double_logistique_grad(params, time_samples)
-    diff = (f - samples)
+    _, diff, df = double_logistique_fused(
+        np.asarray(params)[np.newaxis, :], time_samples, np.asarray(samples)[np.newaxis, :])
 
-    grad = 2 * (df*diff).mean(axis=1)
+    grad = 2 * (df[0]*diff).mean(axis=1)
 
     return grad
+
+
+def _logistic(x, s, t, dtype):
+    """
+    1/(1+exp((x-t)/s)) with the exponent clipped to avoid overflow in dtype.
+    """
+    max_exponent = np.log(np.finfo(dtype).max) - 1
+    exponent = np.clip((x-t)/s, -max_exponent, max_exponent)
+    return 1/(1+np.exp(exponent))
+
+
+def double_logistique_fused(params, t, samples=None, jacobian=True, dtype=None):
+    """
+    Value, residual and Jacobian of the double logistic for a batch of parameters.
+
+    Each exponential is computed once : the derivatives of f = 1/(1+exp((x-t)/s))
+    only need f*(1-f).
+
+    params : array (n_samples, 6), one line of parameters per sample
+    t : time samples
+    samples : array (n_samples, n_time_samples) or None
+    jacobian : bool, if False the Jacobian is not computed
+    dtype : float32 or float64, default is the dtype of params and t (at least float32)
+
+    Return f (n_samples, n_time_samples), the residual f - samples (None if samples is None)
+    and the Jacobian (n_samples, 6, n_time_samples) (None if not jacobian).
+    """
+    if dtype is None:
+        dtype = np.result_type(params, t, np.float32)
+    params = np.asarray(params, dtype=dtype)
+    t = np.asarray(t, dtype=dtype)
+    A, B, x0, x1, x2, x3 = [params[:, [i]] for i in range(6)]
+
+    f1 = _logistic(x0, x1, t, dtype)
+    f2 = _logistic(x2, x3, t, dtype)
+    f = A*(f1 - f2) + B
+
+    residual = None if samples is None else f - samples
+
+    df = None
+    if jacobian:
+        g1 = f1 * (1 - f1)
+        g2 = f2 * (1 - f2)
+        df = np.empty((params.shape[0], 6, t.size), dtype=dtype)
+        df[:, 0, :] = f1 - f2
+        df[:, 1, :] = 1
+        df[:, 2, :] = -A / x1 * g1
+        df[:, 3, :] = A * (x0-t) / x1**2 * g1
+        df[:, 4, :] = A / x3 * g2
+        df[:, 5, :] = -A * (x2-t) / x3**2 * g2
+
+    return f, residual, df
+
+
+def double_logistique_batch(params, t):
+    """
+    params : array (n_samples, 6), one line of parameters per sample
+    t : time samples
+
+    Return array (n_samples, n_time_samples)
+    """
+    return double_logistique_fused(params, t, jacobian=False)[0]
+
+
+def double_logistique_grad_batch(params, t):
+    """
+    params : array (n_samples, 6), one line of parameters per sample
+    t : time samples
+
+    Return array (n_samples, 6, n_time_samples)
+    """
+    return double_logistique_fused(params, t)[2]
+
+
+def cost_function_batch(params, time_samples, samples):
+    """
+    Mean squared error of each sample (params is (n_samples, 6)).
+    """
+    f = double_logistique_batch(params, time_samples)
+    return ((f - samples)**2).mean(axis=1)
+
+
+def initial_parameters(time_samples, samples):
+    """
+    Initial parameters computed from the data of each sample.
+
+    A and B come from the amplitude and the minimum, x0 and x2 from the dates
+    where the series crosses half of the amplitude before and after its peak,
+    x1 and x3 from the distance between these dates and the peak.
+
+    Return array (n_samples, 6)
+    """
+    t = np.asarray(time_samples, dtype=np.float64)
+    samples = np.asarray(samples, dtype=np.float64)
+    cols = np.arange(t.size)
+
+    B = samples.min(axis=1)
+    A = samples.max(axis=1) - B
+    argmax = samples.argmax(axis=1)
+    half = (B + A / 2)[:, np.newaxis]
+
+    rising = np.logical_and(cols <= argmax[:, np.newaxis], samples >= half)
+    x0 = t[rising.argmax(axis=1)]
+
+    falling = np.logical_and(cols > argmax[:, np.newaxis], samples <= half)
+    x2 = np.where(falling.any(axis=1), t[falling.argmax(axis=1)], t[-1])
+
+    min_width = np.median(np.diff(t)) / 2 if t.size > 1 else 1.
+    t_peak = t[argmax]
+    x1 = np.maximum((t_peak - x0) / 2, min_width)
+    x3 = np.maximum((x2 - t_peak) / 2, min_width)
+
+    return np.column_stack((A, B, x0, x1, x2, x3))
+
+
+def sos_eos_from_params(params, sos=0.2, eos=0.8):
+    """
+    Closed-form start and end of season of fitted double logistic curves.
+
+    SOS is the date where the green-up term reaches sos of the amplitude,
+    EOS the date where the senescence term has brought the curve back to eos
+    of the amplitude (same thresolds as get_phenology_metrics).
+
+    params : array (n_samples, 6), one line of parameters per sample
+    sos : float or array, fraction of the amplitude
+    eos : float or array, fraction of the amplitude
+
+    Return two arrays (n_samples, ...) of dates, nan where the curve has no season
+    (A, x1 or x3 not positive) or the thresold is not in ]0,1[.
+    """
+    params = np.asarray(params, dtype=np.float64)
+    A, B, x0, x1, x2, x3 = [params[:, [i]] for i in range(6)]
+    sos = np.atleast_1d(np.asarray(sos, dtype=np.float64))
+    eos = np.atleast_1d(np.asarray(eos, dtype=np.float64))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_sos = x0 + x1 * np.log(sos / (1 - sos))
+        t_eos = x2 + x3 * np.log((1 - eos) / eos)
+
+    valid = (A > 0) & (x1 > 0) & (x3 > 0)
+    t_sos[~valid[:, 0], :] = np.nan
+    t_eos[~valid[:, 0], :] = np.nan
+    t_sos[:, (sos <= 0) | (sos >= 1)] = np.nan
+    t_eos[:, (eos <= 0) | (eos >= 1)] = np.nan
+
+    return t_sos, t_eos
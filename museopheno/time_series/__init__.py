@@ -17,54 +17,432 @@ The :mod:`museopheno.time_series` module gathers functions to compute expression
 smooth time series.
 """
 import datetime as dt
+import functools
 
 import math
+import multiprocessing
+import time
+import warnings
 import numpy as np
 np.seterr(divide='ignore')
 
 from scipy import interpolate
 from scipy import signal
-from scipy.ndimage import median_filter
+from scipy import sparse
 from scipy.optimize import minimize, Bounds
 
 from museopheno.time_series import __dl as fun_dl # double logistic by M. Fauvel
+from museopheno.time_series import __models as fun_models
 
 import re
 
-def get_phenology_metrics(X,sos=0.2,eos=0.8,min_from_year=False):
+MODELS = list(fun_models.MODELS)
+
+PHENOLOGY_METRICS = ['sos', 'eos', 'los', 'peak_value', 'peak_date', 'amplitude', 'base',
+                     'area_season', 'area_total', 'greenup_rate', 'senescence_rate',
+                     'sos_value', 'eos_value']
+
+
+def get_phenology_metrics(X,sos=0.2,eos=0.8,min_from_year=False,metrics=['sos','eos'],dates=False,fractional=False):
     """
     Return indices of phenology metrics (start of season and end of season).
     
+    Metrics are computed for all the samples at once. Same results as 
+    :class:`PhenologyMetrics` for each sample.
+    
     Parameters
     ----------
     X : array
         array can be two dimensions (a line per sample)
-    sos : float, optional (default=0.2)
-        Percentage (0.2 for 20%) of the season amplitude
-    eos : float, optional (default=0.8)
-        Percentage (0.8 for 80%) of the season amplitude
+    sos : float or array, optional (default=0.2)
+        Percentage (0.2 for 20%) of the season amplitude.
+        An array (e.g. [0.2, 0.5, 0.8]) computes each thresold in the same pass.
+    eos : float or array, optional (default=0.8)
+        Percentage (0.8 for 80%) of the season amplitude.
+        An array must have the same length as sos (or a single value).
     min_from_year  : bool, optional (default=False)
         If True, metrics thresolds will be computed using the min from the year
         If False, metrics thresolds will be computed using the min from the season (start or end).
+    metrics : list, optional (default=['sos','eos'])
+        Metrics to compute, in the order of the output columns. Available metrics are :
+            
+            - 'sos', 'eos' : index of the start and end of season
+            - 'los' : length of season (number of indices between sos and eos)
+            - 'peak_value', 'peak_date' : value and index of the maximum
+            - 'base' : mean of the minimum before and after the peak
+            - 'amplitude' : peak value minus base
+            - 'area_season' : area under the curve between sos and eos
+            - 'area_total' : area under the whole curve
+            - 'greenup_rate' : increase per date unit from sos to the peak
+            - 'senescence_rate' : decrease per date unit from the peak to eos
+            - 'sos_value', 'eos_value' : values at sos and eos
+    dates : array or False, optional (default=False)
+        Dates of each column (e.g. :attr:`SmoothSignal.output_dates_int`), used for areas and rates.
+        If False, one unit between each column.
+    fractional : bool, optional (default=False)
+        If True, SOS and EOS are linearly interpolated between the two dates around the thresold crossing,
+        so indices are fractional (e.g. 12.4).
     
     Returns
     -------
-    Array with as many lines as samples.
-    First column is SOS index, second is EOS index.
+    Array with as many lines as samples and one column per metric.
+    By default, first column is SOS index, second is EOS index.
+    If the thresold is never reached, index is nan.
+    If sos or eos is an array, array of shape (n_samples, n_thresolds, n_metrics).
 
     """
-    if X.ndim==2 and X.shape[0] != 1:
-        feats = np.zeros((X.shape[0],2))
-        for feature in range(X.shape[0]):
-            feat = PhenologyMetrics(X[feature,...],sos,eos,min_from_year=min_from_year)    
-            feats[feature,:] = feat.sos,feat.eos
-            
+    X = np.atleast_2d(np.asarray(X))
+    argmin_sos, argmax, argmin_eos = _get_season_extrema(X)
+    values = _get_season_metrics(
+        X, argmin_sos, argmax, argmin_eos, sos, eos, min_from_year, metrics, dates, fractional)
+    
+    if np.ndim(sos) == 0 and np.ndim(eos) == 0:
+        feats = np.column_stack([values[metric] for metric in metrics])
     else:
-        feat = PhenologyMetrics(X,sos,eos,min_from_year=min_from_year)
-        feats = np.asarray([feat.sos,feat.eos]).reshape(-1,2)
+        # metrics which do not depend on the thresolds are repeated for each of them
+        n_thresolds = values['sos'].shape[1]
+        feats = np.stack([np.broadcast_to(values[metric].reshape(X.shape[0], -1), (X.shape[0], n_thresolds))
+                          for metric in metrics], axis=-1)
+        
+    return feats
+
+
+def get_multi_season_metrics(X, sos=0.2, eos=0.8, min_prominence=0.1, min_season_length=3, max_seasons=2,
+                             metrics=['sos','eos','los'], dates=False, fractional=False, nodata=-9999):
+    """
+    Return phenology metrics of each season (e.g. double-cropping or several years).
+    
+    Seasons are detected for all the samples at once : each local maximum is a season peak,
+    peaks whose prominence is below min_prominence are merged with their neighbour
+    (the least prominent first), then the max_seasons most prominent are kept.
+    Each season goes from the minimum before its peak to the minimum after it, and its 
+    metrics are computed as in :func:`get_phenology_metrics`.
+    
+    Parameters
+    ----------
+    X : array
+        array can be two dimensions (a line per sample)
+    sos : float, optional (default=0.2)
+        Percentage (0.2 for 20%) of the season amplitude
+    eos : float, optional (default=0.8)
+        Percentage (0.8 for 80%) of the season amplitude
+    min_prominence : float, optional (default=0.1)
+        Minimum height of a peak above the highest of the minima before and after it.
+    min_season_length : int, optional (default=3)
+        Minimum number of indices between the minima before and after a peak.
+    max_seasons : int, optional (default=2)
+        Maximum number of seasons per sample.
+    metrics : list, optional (default=['sos','eos','los'])
+        Metrics to compute for each season. See :func:`get_phenology_metrics`.
+    dates : array or False, optional (default=False)
+        Dates of each column, used for areas and rates.
+    fractional : bool, optional (default=False)
+        If True, SOS and EOS are fractional indices.
+    nodata : float, optional (default=-9999)
+        Value of missing seasons and metrics.
+    
+    Returns
+    -------
+    Array of shape (n_samples, max_seasons, n_metrics). Seasons are ordered by date.
+    Use reshape(X.shape[0], -1) to write it as raster bands.
+    
+    Example
+    -------
+    >>> seasons = get_multi_season_metrics(X_smooth, min_prominence=0.2, max_seasons=2)
+    >>> seasons[:, 0, :] # sos, eos and los of the first season
+    """
+    X = np.atleast_2d(np.asarray(X))
+    n_samples, n_dates = X.shape
+    
+    peaks = np.zeros(X.shape, dtype=bool)
+    peaks[:, 1:-1] = np.logical_and(X[:, 1:-1] > X[:, :-2], X[:, 1:-1] >= X[:, 2:])
+    
+    left_valley = np.zeros(X.shape, dtype=np.int64)
+    right_valley = np.zeros(X.shape, dtype=np.int64)
+    prominence = np.full(X.shape, -np.inf)
+    
+    # remove peaks which are not prominent enough, starting with those which
+    # are less prominent than their neighbour peaks, until all are prominent enough
+    rows = np.arange(n_samples)
+    while rows.size > 0:
+        left, right = _get_valleys(X[rows], peaks[rows])
+        left_valley[rows], right_valley[rows] = left, right
+        row_values = X[rows]
+        row_peaks = peaks[rows]
+        row_prominence = np.where(
+            row_peaks,
+            row_values - np.maximum(np.take_along_axis(row_values, left, axis=1),
+                                    np.take_along_axis(row_values, right, axis=1)),
+            np.inf)
+        prominence[rows] = np.where(row_peaks, row_prominence, -np.inf)
         
+        previous_prominence, next_prominence = _get_neighbour_peaks_values(row_peaks, row_prominence)
+        to_remove = row_peaks & (row_prominence < min_prominence) & \
+            (row_prominence < previous_prominence) & (row_prominence <= next_prominence)
+        
+        changed = to_remove.any(axis=1)
+        rows, to_remove = rows[changed], to_remove[changed]
+        peaks[rows] &= ~to_remove
+        prominence[rows] = np.where(to_remove, -np.inf, prominence[rows])
+    
+    prominence[right_valley - left_valley < min_season_length] = -np.inf
+    
+    # most prominent seasons, by date
+    selected = np.argsort(-prominence, axis=1, kind='stable')[:, :max_seasons]
+    selected_prominence = np.take_along_axis(prominence, selected, axis=1)
+    selected = np.where(np.isfinite(selected_prominence), selected, n_dates)
+    selected = np.sort(selected, axis=1)
+    
+    feats = np.full((n_samples, max_seasons, len(metrics)), nodata, dtype=np.float64)
+    for season in range(min(max_seasons, n_dates)):
+        argmax = selected[:, season]
+        has_season = argmax < n_dates
+        if not np.any(has_season):
+            break
+        argmax = argmax[has_season]
+        season_rows = np.flatnonzero(has_season)
+        values = _get_season_metrics(
+            X[season_rows], left_valley[season_rows, argmax], argmax, right_valley[season_rows, argmax],
+            sos, eos, False, metrics, dates, fractional)
+        season_feats = np.column_stack([values[metric] for metric in metrics])
+        feats[season_rows, season, :] = np.where(np.isnan(season_feats), nodata, season_feats)
+    
     return feats
 
+
+def _get_neighbour_peaks_values(peaks, values):
+    """
+    For each position, value of the previous and of the next peak (inf if none).
+    """
+    n_samples, n_dates = peaks.shape
+    positions = np.arange(n_dates)
+    padded = np.hstack((values, np.full((n_samples, 1), np.inf)))
+    
+    last_peak = np.maximum.accumulate(np.where(peaks, positions, -1), axis=1)
+    previous_peak = np.full(peaks.shape, -1)
+    previous_peak[:, 1:] = last_peak[:, :-1]
+    previous_peak[previous_peak < 0] = n_dates
+    
+    first_peak = np.minimum.accumulate(np.where(peaks, positions, n_dates)[:, ::-1], axis=1)[:, ::-1]
+    next_peak = np.full(peaks.shape, n_dates)
+    next_peak[:, :-1] = first_peak[:, 1:]
+    
+    return np.take_along_axis(padded, previous_peak, axis=1), np.take_along_axis(padded, next_peak, axis=1)
+
+
+def _get_valleys(X, peaks):
+    """
+    Position of the minimum between each peak and the previous (left) or
+    next (right) peak, or the edge of the series. Only relevant at peaks.
+    """
+    n_samples, n_dates = X.shape
+    # one contiguous line per date, as the loop is on dates
+    X_dates = np.ascontiguousarray(X.T)
+    peaks_dates = np.ascontiguousarray(peaks.T)
+    left = np.zeros((n_dates, n_samples), dtype=np.int64)
+    right = np.zeros((n_dates, n_samples), dtype=np.int64)
+    
+    for valley, dates, strict in ((left, range(n_dates), True),
+                                  (right, range(n_dates - 1, -1, -1), False)):
+        min_value = np.full(n_samples, np.inf)
+        min_position = np.zeros(n_samples, dtype=np.int64)
+        for date in dates:
+            is_peak = peaks_dates[date]
+            valley[date] = min_position
+            # first position of the minimum in both directions
+            if strict:
+                lower = X_dates[date] < min_value
+            else:
+                lower = X_dates[date] <= min_value
+            lower &= ~is_peak
+            min_value = np.where(lower, X_dates[date], min_value)
+            min_position = np.where(lower, date, min_position)
+            min_value[is_peak] = np.inf
+    
+    return left.T, right.T
+
+
+def _get_season_extrema(X):
+    """
+    Position of the maximum and of the minimum before and after it, for each line.
+    """
+    cols = np.arange(X.shape[1])
+    argmax = np.argmax(X, axis=1)
+    before_max = cols < argmax[:, np.newaxis]
+    argmin_sos = np.argmin(np.where(before_max, X, np.inf), axis=1)
+    argmin_sos[argmax == 0] = 0
+    argmin_eos = np.argmin(np.where(before_max, np.inf, X), axis=1)
+    
+    return argmin_sos, argmax, argmin_eos
+
+
+def _get_first_crossing(X, start, stop, thresold, above=True, fractional=False):
+    """
+    First position between start and stop (both included) where each line of X
+    is above (or below) its thresold. nan if the thresold is never reached.
+    
+    If fractional, the position is linearly interpolated between the crossing
+    and the previous position.
+    """
+    cols = np.arange(X.shape[1])
+    if above:
+        crossing = X >= thresold[:, np.newaxis]
+    else:
+        crossing = X <= thresold[:, np.newaxis]
+    crossing &= cols >= start[:, np.newaxis]
+    crossing &= cols <= stop[:, np.newaxis]
+    
+    idx = np.argmax(crossing, axis=1).astype(np.float64)
+    idx[~crossing.any(axis=1)] = np.nan
+    
+    if fractional:
+        rows = np.flatnonzero(idx > start)
+        previous = idx[rows].astype(np.int64) - 1
+        val_previous = X[rows, previous]
+        val_crossing = X[rows, previous + 1]
+        idx[rows] = previous + (thresold[rows] - val_previous) / (val_crossing - val_previous)
+    
+    return idx
+
+
+def _get_season_sos_eos(X, argmin_sos, argmax, argmin_eos, sos=0.2, eos=0.8, min_from_year=False,
+                        fractional=False):
+    """
+    Start and end of season of each line of X, from the season extrema.
+    
+    If sos and eos are arrays of thresolds, amplitudes are computed once and
+    arrays of shape (n_samples, n_thresolds) are returned.
+    """
+    rows = np.arange(X.shape[0])
+    val_max = X[rows, argmax]
+    val_min_sos = X[rows, argmin_sos]
+    val_min_eos = X[rows, argmin_eos]
+    
+    if min_from_year:
+        val_min = np.minimum(val_min_sos, val_min_eos)
+        amp_sos = val_max - val_min
+        amp_eos = val_max - val_min
+    else:
+        amp_sos = val_max - val_min_sos
+        amp_eos = val_max - val_min_eos
+    
+    if np.ndim(sos) == 0 and np.ndim(eos) == 0:
+        idx_sos = _get_first_crossing(
+            X, argmin_sos, argmax, val_min_sos + sos * amp_sos, above=True, fractional=fractional)
+        idx_eos = _get_first_crossing(
+            X, argmax, argmin_eos, val_max - (1 - eos) * amp_eos, above=False, fractional=fractional)
+        return idx_sos, idx_eos
+    
+    sos, eos = np.broadcast_arrays(np.atleast_1d(sos), np.atleast_1d(eos))
+    idx_sos = np.empty((X.shape[0], sos.size))
+    idx_eos = np.empty((X.shape[0], eos.size))
+    for thresold in range(sos.size):
+        idx_sos[:, thresold] = _get_first_crossing(
+            X, argmin_sos, argmax, val_min_sos + sos[thresold] * amp_sos, above=True, fractional=fractional)
+        idx_eos[:, thresold] = _get_first_crossing(
+            X, argmax, argmin_eos, val_max - (1 - eos[thresold]) * amp_eos, above=False, fractional=fractional)
+    
+    return idx_sos, idx_eos
+
+
+def _take(X, idx):
+    """
+    Value of each line of X at idx (nan where idx is nan), linearly
+    interpolated if idx is fractional.
+    """
+    values = np.full(X.shape[0], np.nan)
+    rows = np.flatnonzero(np.isfinite(idx))
+    lower = np.floor(idx[rows]).astype(np.int64)
+    upper = np.minimum(lower + 1, X.shape[1] - 1)
+    weight = idx[rows] - lower
+    values[rows] = X[rows, lower] * (1 - weight) + X[rows, upper] * weight
+    return values
+
+
+def _get_season_metrics(X, argmin_sos, argmax, argmin_eos, sos=0.2, eos=0.8, min_from_year=False,
+                        metrics=['sos','eos'], dates=False, fractional=False):
+    """
+    Dict of the asked metrics of each line of X, from the season extrema.
+    
+    Extrema, thresolds and crossings are shared by every metric.
+    """
+    for metric in metrics:
+        if metric not in PHENOLOGY_METRICS:
+            raise ValueError('{} is not an available metric. Please select one of them : {}'.format(
+                metric, ', '.join(PHENOLOGY_METRICS)))
+    
+    if dates is False:
+        dates = np.arange(X.shape[1])
+    dates = np.asarray(dates, dtype=np.float64)
+    rows = np.arange(X.shape[0])
+    values = {}
+    
+    values['sos'], values['eos'] = _get_season_sos_eos(
+        X, argmin_sos, argmax, argmin_eos, sos, eos, min_from_year, fractional)
+    
+    values['peak_value'] = X[rows, argmax].astype(np.float64)
+    values['peak_date'] = argmax.astype(np.float64)
+    values['base'] = (X[rows, argmin_sos].astype(np.float64) + X[rows, argmin_eos]) / 2
+    values['amplitude'] = values['peak_value'] - values['base']
+    
+    area = None
+    if 'area_season' in metrics or 'area_total' in metrics:
+        # cumulative area under the curve (trapezoidal rule)
+        area = np.zeros(X.shape, dtype=np.float64)
+        np.cumsum((X[:, 1:] + X[:, :-1]) / 2 * np.diff(dates), axis=1, out=area[:, 1:])
+        values['area_total'] = area[:, -1]
+    
+    # metrics which depend on the thresolds, computed for each of them
+    if values['sos'].ndim == 1:
+        values.update(_get_thresold_metrics(X, values, values['sos'], values['eos'], argmax, area, dates, metrics))
+    else:
+        per_thresold = [
+            _get_thresold_metrics(X, values, values['sos'][:, i], values['eos'][:, i], argmax, area, dates, metrics)
+            for i in range(values['sos'].shape[1])]
+        for metric in per_thresold[0]:
+            values[metric] = np.column_stack([thresold_values[metric] for thresold_values in per_thresold])
+    
+    return values
+
+
+def _get_thresold_metrics(X, values, idx_sos, idx_eos, argmax, area, dates, metrics):
+    """
+    Metrics which depend on the start and end of season of one thresold.
+    """
+    thresold_values = {}
+    thresold_values['los'] = idx_eos - idx_sos
+    
+    if 'sos_value' in metrics or 'greenup_rate' in metrics:
+        thresold_values['sos_value'] = _take(X, idx_sos)
+    if 'eos_value' in metrics or 'senescence_rate' in metrics:
+        thresold_values['eos_value'] = _take(X, idx_eos)
+    
+    if 'greenup_rate' in metrics:
+        delta = dates[argmax] - np.interp(idx_sos, np.arange(dates.size), dates)
+        thresold_values['greenup_rate'] = np.where(
+            delta > 0, (values['peak_value'] - thresold_values['sos_value']) / delta, np.nan)
+    if 'senescence_rate' in metrics:
+        delta = np.interp(idx_eos, np.arange(dates.size), dates) - dates[argmax]
+        thresold_values['senescence_rate'] = np.where(
+            delta > 0, (values['peak_value'] - thresold_values['eos_value']) / delta, np.nan)
+    
+    if area is not None:
+        thresold_values['area_season'] = _get_area_at(X, area, dates, idx_eos) - _get_area_at(X, area, dates, idx_sos)
+    
+    return thresold_values
+
+
+def _get_area_at(X, area, dates, idx):
+    """
+    Cumulative area at idx, completed with the trapezoid from the previous
+    position when idx is fractional.
+    """
+    lower = np.where(np.isfinite(idx), np.floor(idx), np.nan)
+    partial = (_take(X, lower) + _take(X, idx)) / 2 * (
+        np.interp(idx, np.arange(dates.size), dates) - np.interp(lower, np.arange(dates.size), dates))
+    return _take(area, lower) + partial
+
+
 class PhenologyMetrics:
     """
     Get phenology metrics from one feature.
@@ -325,8 +703,374 @@ def expression_manager(X, bands_order, expression, interpolate_nan=True,
         return outIndice
 
 
+def _rolling_median(X, window_length):
+    """
+    Moving median along the last axis (one line per pixel).
+
+    Edges are handled as :class:`scipy.ndimage.median_filter` does with its
+    default 'reflect' mode.
+    """
+    n_dates = X.shape[-1]
+    origin = window_length // 2
+    X_pad = np.pad(X, ((0, 0), (origin, window_length - origin - 1)), mode='symmetric')
+    windows = np.lib.stride_tricks.as_strided(
+        X_pad,
+        shape=(X_pad.shape[0], n_dates, window_length),
+        strides=X_pad.strides + X_pad.strides[-1:],
+        writeable=False)
+
+    return np.partition(windows, origin, axis=-1)[..., origin]
+
+
+def _iterative_rolling_median(X, window_length=3, n_iter=10):
+    """
+    Apply the moving median until convergence or until n_iter passes.
+
+    Only pixels which are still changing are filtered at each pass.
+    """
+    X = np.array(X, ndmin=2)
+    to_filter = np.arange(X.shape[0])
+    for _ in range(n_iter):
+        X_median = _rolling_median(X[to_filter, :], window_length)
+        changed = np.any(X_median != X[to_filter, :], axis=1)
+        X[to_filter, :] = X_median
+        to_filter = to_filter[changed]
+        if to_filter.size == 0:
+            break
+
+    return X
+
+
+def _fit_double_logistic(X, time_samples, params, method='L-BFGS-B', maxiter=100,
+                         warm_start=False, previous=None, deadline=None, iteration_budget=None):
+    """
+    Fit the double logistic on each line of X.
+
+    params are the initial parameters (one line per pixel). If warm_start,
+    a pixel starts from the solution of its neighbour (or from previous for
+    the batched fit) when it fits the pixel better than its own params.
+    
+    Once time.time() is after deadline or the iterations of all pixels reach
+    iteration_budget, remaining pixels keep their params and are not converged.
+
+    Returns the fitted parameters (one line per pixel), the number of
+    iterations and the convergence flag of each pixel.
+    """
+    time_samples = np.asarray(time_samples)
+    params = np.array(np.broadcast_to(params, (X.shape[0], 6)), dtype=np.float64)
+    if method == 'LM':
+        if warm_start and previous is not None:
+            better = fun_dl.cost_function_batch(
+                np.broadcast_to(previous, params.shape), time_samples, X) < fun_dl.cost_function_batch(params, time_samples, X)
+            params[better, :] = previous
+        return fun_models.fit(
+            'double_logistic', params, time_samples, X, maxiter=maxiter, deadline=deadline,
+            iteration_budget=iteration_budget)
+    elif method != 'L-BFGS-B':
+        raise ValueError('method must be \'L-BFGS-B\' or \'LM\'.')
+
+    fitted = params.copy()
+    n_iter = np.zeros(X.shape[0], dtype=np.int64)
+    converged = np.zeros(X.shape[0], dtype=bool)
+    for n_row in range(X.shape[0]):
+        if deadline is not None and time.time() > deadline:
+            break
+        if iteration_budget is not None and n_iter.sum() >= iteration_budget:
+            break
+        
+        increase_max = maxiter
+        if iteration_budget is not None:
+            increase_max = min(maxiter, int(iteration_budget - n_iter.sum()))
+            if increase_max == 0:
+                break
+    
+        init = params[n_row, :]
+        neighbour = fitted[n_row-1, :] if n_row > 0 else previous
+        if warm_start and neighbour is not None:
+            if fun_dl.cost_function(neighbour, time_samples, X[n_row, :]) < fun_dl.cost_function(init, time_samples, X[n_row, :]):
+                init = neighbour
+
+        solver = fun_dl.minimize(fun_dl.cost_function,
+                          init,
+                          args=(time_samples, X[n_row,:]),
+                          method='L-BFGS-B',
+                          jac=fun_dl.cost_function_grad,                                 
+                          options={'gtol': 1e-10,
+                                   'ftol': 1e-10,
+                                   'maxiter':increase_max,
+                                   'maxcor':increase_max,
+                                   'maxfun':increase_max,
+                                   'maxls':1000})
+        fitted[n_row, :] = solver.x
+        n_iter[n_row] = solver.nit
+        converged[n_row] = solver.success
+        
+    return fitted, n_iter, converged
+
+
+# state shared by each worker of the fitting pool, set once at startup
+_fit_worker_state = {}
+
+
+def _init_fit_worker(time_samples, method, maxiter, warm_start):
+    _fit_worker_state.update(
+        time_samples=time_samples, method=method, maxiter=maxiter, warm_start=warm_start)
+
+
+def _fit_double_logistic_chunk(chunk):
+    start, X, params, previous, deadline, iteration_budget = chunk
+    return start, _fit_double_logistic(
+        X, params=params, previous=previous, deadline=deadline, iteration_budget=iteration_budget,
+        **_fit_worker_state)
+
+
+FIT_DIAGNOSTICS = ['rmse', 'n_iter', 'converged', 'fallback']
+
+
+def _fit_diagnostics_to_array(fit_diagnostics):
+    """
+    Per-pixel diagnostics as columns : rmse, n_iter, converged then each parameter.
+    """
+    return np.column_stack(
+        [fit_diagnostics[name] for name in FIT_DIAGNOSTICS] + [fit_diagnostics['params']])
+
+
+class TimeAxis:
+    """
+    Time axis of a time series, stored as numpy datetime64 (day precision).
+
+    Dates are parsed, converted to day of year or to integer offsets at once
+    for the whole axis.
+
+    Parameters
+    -----------
+    dates : list or array
+        list of dates. E.g. [20180101, 20180201] or ['2018-01-01','2018-02-01'].
+    fmt : str, default '%Y%m%d'
+        Input format of dates. Default is '%Y%m%d', so '20181231'.
+        '%Y%m%d' and '%Y-%m-%d' are parsed without any loop.
+
+    Example
+    --------
+    >>> axis = TimeAxis([20180429, 20180513, 20180708])
+    >>> axis.doy
+    array([119, 133, 189])
+    >>> axis.to_int()
+    array([ 0, 14, 70])
+    >>> TimeAxis.arange(20180115, 20180601, step=1, unit='M').to_yyyymmdd()
+    array([20180115, 20180215, 20180315, 20180415, 20180515, 20180615])
+    """
+
+    def __init__(self, dates, fmt='%Y%m%d'):
+        self.dates = self.parse(dates, fmt=fmt)
+
+    def __len__(self):
+        return self.dates.size
+
+    @staticmethod
+    def parse(dates, fmt='%Y%m%d'):
+        """
+        Convert dates to a numpy datetime64 array (day precision).
+
+        Parameters
+        -----------
+        dates : list or array
+            List of dates (int or str in fmt, datetime64, datetime or date)
+        fmt : str
+            Format type of each date
+        """
+        if isinstance(dates, TimeAxis):
+            return dates.dates
+        dates = np.atleast_1d(np.asarray(dates))
+
+        if np.issubdtype(dates.dtype, np.datetime64):
+            return dates.astype('datetime64[D]')
+        if dates.dtype == object and all(isinstance(date, dt.date) for date in dates):
+            # datetime.datetime is a subclass of datetime.date
+            return np.asarray([np.datetime64(date, 'D') for date in dates], dtype='datetime64[D]')
+
+        if fmt == '%Y%m%d':
+            yyyymmdd = dates.astype(np.int64)
+            months = (yyyymmdd // 10000 - 1970) * 12 + yyyymmdd // 100 % 100 - 1
+            datetimes = months.astype('datetime64[M]').astype('datetime64[D]') + (yyyymmdd % 100 - 1)
+            if np.any(_datetime64_to_yyyymmdd(datetimes) != yyyymmdd):
+                raise ValueError('Some dates do not match the format {}.'.format(fmt))
+            return datetimes
+        elif fmt == '%Y-%m-%d':
+            return dates.astype('datetime64[D]')
+        else:
+            return np.asarray([dt.datetime.strptime(str(date), fmt).date() for date in dates], dtype='datetime64[D]')
+
+    @classmethod
+    def arange(cls, start_date, last_date, step=5, unit='D', fmt='%Y%m%d'):
+        """
+        Regular time axis from start_date, every step days (unit='D') or
+        months (unit='M'), until last_date is reached or passed.
+
+        Parameters
+        -----------
+        start_date : int or str
+            First date.
+        last_date : int or str
+            The axis stops at the first date equal or after this one.
+        step : int, default 5
+            Delta between two dates.
+        unit : str, default 'D'
+            'D' for days, 'M' for months. With months, the day of start_date
+            is kept (or the last day of the month if it does not exist).
+        fmt : str, default '%Y%m%d'
+            Format type of start_date and last_date.
+        """
+        start_date = cls.parse(start_date, fmt=fmt)[0]
+        last_date = cls.parse(last_date, fmt=fmt)[0]
+
+        if unit == 'D':
+            n_steps = max(int(np.ceil((last_date - start_date).astype(np.int64) / step)), 0)
+            dates = start_date + np.arange(n_steps + 1) * step
+        elif unit == 'M':
+            start_month = start_date.astype('datetime64[M]')
+            day = (start_date - start_month.astype('datetime64[D]')).astype(np.int64)
+            # one step after the month of last_date is enough to reach it
+            months = np.arange(start_month, max(start_month, last_date.astype('datetime64[M]')) + step + 1, step)
+            # clip day to the last day of each month
+            month_length = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64)
+            dates = months.astype('datetime64[D]') + np.minimum(day, month_length - 1)
+            dates = dates[:np.argmax(dates >= last_date) + 1]
+        else:
+            raise ValueError('unit must be \'D\' or \'M\'.')
+
+        return cls(dates)
+
+    @property
+    def doy(self):
+        """
+        Day Of Year (DOY) of each date.
+        """
+        return (self.dates - self.dates.astype('datetime64[Y]')).astype(np.int64) + 1
+
+    def to_int(self, start_date=None):
+        """
+        Number of days since start_date (default is the first date of the axis).
+
+        Parameters
+        -----------
+        start_date : None, datetime64 or datetime
+        """
+        if start_date is None:
+            start_date = self.dates[0]
+        return (self.dates - np.datetime64(start_date, 'D')).astype(np.int64)
+
+    def to_datetime(self):
+        """
+        List of dates with datetime type.
+        """
+        return self.dates.astype('datetime64[us]').tolist()
+
+    def to_yyyymmdd(self):
+        """
+        Array of dates as integer (YYYYMMDD).
+        """
+        return _datetime64_to_yyyymmdd(self.dates)
+
+
+def _datetime64_to_yyyymmdd(dates):
+    months = dates.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]').astype(np.int64) + 1970
+    days = (dates - months.astype('datetime64[D]')).astype(np.int64) + 1
+    return years * 10000 + (months.astype(np.int64) % 12 + 1) * 100 + days
+
+
+def _harmonic_design_matrix(dates_int, n_harmonics, period):
+    """
+    Columns are 1, then cos and sin of each harmonic.
+    """
+    omega = 2 * np.pi * np.asarray(dates_int, dtype=np.float64)[:, np.newaxis] / period
+    harmonics = np.arange(1, n_harmonics + 1)
+    design = np.empty((omega.shape[0], 2 * n_harmonics + 1))
+    design[:, 0] = 1
+    design[:, 1::2] = np.cos(omega * harmonics)
+    design[:, 2::2] = np.sin(omega * harmonics)
+    return design
+
+
+def _harmonic_coefficients_to_amplitude_phase(coefs):
+    """
+    From [mean, cos1, sin1, cos2, sin2...] to [mean, amp1, amp2..., phase1, phase2...].
+    """
+    cos, sin = coefs[:, 1::2], coefs[:, 2::2]
+    return np.hstack((coefs[:, :1], np.hypot(cos, sin), np.arctan2(sin, cos)))
+
+
+def _local_polynomial_weights(dates_int, output_dates_int, window_length, polyorder):
+    """
+    Sparse matrix (n_output_dates, n_dates) of local least-squares weights.
+
+    For each output date, a polynomial of degree polyorder is fitted on the
+    window_length nearest dates, and the row holds the weights giving its
+    value at the output date.
+    """
+    dates_int = np.asarray(dates_int, dtype=np.float64)
+    output_dates_int = np.asarray(output_dates_int, dtype=np.float64)
+    if window_length > dates_int.size:
+        raise ValueError('window_length must be less than or equal to the number of dates.')
+    if polyorder >= window_length:
+        raise ValueError('polyorder must be less than window_length.')
+
+    distance = np.abs(output_dates_int[:, np.newaxis] - dates_int)
+    neighbours = np.argsort(distance, axis=1, kind='stable')[:, :window_length]
+
+    # centered and scaled local dates to keep the system well conditioned
+    local_dates = dates_int[neighbours] - output_dates_int[:, np.newaxis]
+    scale = np.maximum(np.abs(local_dates).max(axis=1, keepdims=True), 1)
+    vandermonde = (local_dates / scale)[..., np.newaxis] ** np.arange(polyorder + 1)
+    weights = np.linalg.pinv(vandermonde)[:, 0, :]
+
+    rows = np.repeat(np.arange(output_dates_int.size), window_length)
+    return sparse.csr_matrix(
+        (weights.ravel(), (rows, neighbours.ravel())),
+        shape=(output_dates_int.size, dates_int.size))
+
+
+def _deduplicate_rows(method):
+    """
+    Decorator which calls method once per unique line of X when SmoothSignal.deduplicate is True.
+    
+    Arrays (and per-pixel arrays of dicts) returned by method are scattered back
+    to every line through the inverse index of np.unique.
+    """
+    @functools.wraps(method)
+    def wrapper(self, X, *args, **kwargs):
+        if self.deduplicate is False or np.ndim(X) != 2:
+            return method(self, X, *args, **kwargs)
+        
+        unique, inverse = np.unique(X, axis=0, return_inverse=True)
+        if unique.shape[0] == X.shape[0]:
+            return method(self, X, *args, **kwargs)
+        inverse = inverse.reshape(-1)
+        n_unique = unique.shape[0]
+        
+        def scatter(value):
+            if isinstance(value, np.ndarray) and value.ndim > 0 and value.shape[0] == n_unique:
+                return value[inverse]
+            elif isinstance(value, dict):
+                return {key: scatter(item) for key, item in value.items()}
+            elif isinstance(value, tuple):
+                return tuple(scatter(item) for item in value)
+            return value
+        
+        # lines are already unique for the methods called by method
+        self.deduplicate = False
+        try:
+            return scatter(method(self, unique, *args, **kwargs))
+        finally:
+            self.deduplicate = True
+    
+    return wrapper
+
+
 class SmoothSignal:
-    def __init__(self, dates, bands_order=False, order_by='date', output_dates=False, fmt='%Y%m%d'):
+    def __init__(self, dates, bands_order=False, order_by='date', output_dates=False, fmt='%Y%m%d',
+                 compute_dtype=np.float32, output_dtype=False, output_scale=1, deduplicate=False):
         """
         Smooth time series signal.
 
@@ -341,6 +1085,17 @@ class SmoothSignal:
         output_dates
         fmt : str, optional.
             Input format of dates. Default is '%Y%m%d', so '20181231'
+        compute_dtype : numpy dtype, default np.float32
+            dtype used to smooth each band of an integer input array. Float inputs keep their dtype.
+        output_dtype : numpy dtype or False, default False
+            dtype of the output. If False, same as the input if it is a float array, else compute_dtype.
+        output_scale : integer or float, default 1
+            Value to multiply the smoothed values before writing them in the output.
+            With an integer output_dtype, values are rounded (e.g. output_dtype=np.int16 and output_scale=10000 to store a NDVI).
+        deduplicate : bool, default False
+            If True, identical pixels (e.g. 20 m bands resampled to 10 m) are smoothed or fitted only once,
+            and results are copied to each of them. Useful for the curve fits, the search of unique
+            lines costs more than it saves for the fastest smoothers.
 
         Example
         --------
@@ -364,31 +1119,54 @@ class SmoothSignal:
         self.bands_order = bands_order
         self.order_by = order_by
 
+        # dtypes
+        self.compute_dtype = compute_dtype
+        self.output_dtype = output_dtype
+        self.output_scale = output_scale
+
         # input dates
         self.init_dates = dates
         self.init_n_dates = len(dates)
-        self.init_datetime = self.convert_to_datetime(dates, fmt=fmt)
-        self.init_dates_int = self._convert_date_to_integer(
-            self.init_datetime, fmt=fmt)
-        self.init_doy = self.convert_to_doy(dates, fmt=fmt)
+        self.init_time_axis = TimeAxis(dates, fmt=fmt)
+        self.init_datetime = self.init_time_axis.to_datetime()
+        self.day0 = self.init_datetime[0]
+        self.init_dates_int = self.init_time_axis.to_int()
+        self.init_doy = self.init_time_axis.doy
 
         # output dates
         if output_dates is False:
             output_dates = dates
         self.output_dates = output_dates
         self.output_n_dates = len(output_dates)
-        self.output_doy = self.convert_to_doy(output_dates, fmt=fmt)
-        self.output_datetime = self.convert_to_datetime(output_dates, fmt=fmt)
-        self.output_dates_int = self._convert_date_to_integer(
-            self.output_datetime, fmt=fmt, start_date = self.init_datetime[0])
+        self.output_time_axis = TimeAxis(output_dates, fmt=fmt)
+        self.output_doy = self.output_time_axis.doy
+        self.output_datetime = self.output_time_axis.to_datetime()
+        self.output_dates_int = self.output_time_axis.to_int(
+            start_date=self.init_time_axis.dates[0])
         
         # if temporal sampling is not the same in output
-        if np.unique(np.diff(self.output_dates_int)).size != 1:
-            raise Warning('Please be careful, the output dates have not the same delta. This could cause some problems.')
+        output_deltas = np.unique(np.diff(self.output_dates_int))
+        if output_deltas.size != 1:
+            warnings.warn('Please be careful, the output dates have not the same delta. This could cause some problems.')
+            self.output_deltadays = None
         else:
-            self.output_deltadays = int(np.unique(np.diff(self.output_dates_int)))
+            self.output_deltadays = int(output_deltas[0])
         # delta
         self.output_dates_delta = self.output_dates_int[1]-self.output_dates_int[0]
+
+        # pool of processes used to fit curves
+        self._pool = None
+        self._pool_key = None
+        self._keep_pool = False
+        # last solution of double_logistic, used for warm start
+        self._warm_params = None
+        # precomputed matrices of the harmonic regression
+        self._harmonic_matrices = {}
+        # precomputed weights of the local polynomial on irregular dates
+        self._local_polynomial_weights = {}
+        # timing and convergence of each block fitted by double_logistic or fit_model
+        self.fit_statistics = []
+        self.deduplicate = deduplicate
     
     def _get_time_series_position_per_band(self, X):
         """
@@ -427,25 +1205,74 @@ class SmoothSignal:
         else:
             multiply_by = 1
         out_x = np.empty(
-            (X.shape[0], len(self.output_dates)*multiply_by), X.dtype)
+            (X.shape[0], len(self.output_dates)*multiply_by), self._get_output_dtype(X))
         self._resize_if_flatten(out_x)
 
         return out_x
 
-    def _convert_date_to_integer(self, dates, fmt='%Y%m%d', convert_to_datetime=False, start_date=False):
-        if convert_to_datetime:
-            dates = self.convert_to_datetime(dates, fmt)
+    def _is_on_output_dates(self, X):
+        """
+        True if the columns of X are the output dates : same dates as the input,
+        or as many columns as output dates but not as input dates.
+        
+        With as many input as output dates, but different dates, X is on the input dates.
+        """
+        if np.array_equal(self.init_dates_int, self.output_dates_int):
+            return True
+        return X.shape[-1] == self.output_n_dates and X.shape[-1] != self.init_n_dates
+
+    def _get_output_dtype(self, X):
+        if self.output_dtype is not False:
+            return self.output_dtype
+        elif np.issubdtype(X.dtype, np.floating):
+            return X.dtype
+        else:
+            return self.compute_dtype
+
+    def _get_compute_dtype(self, X):
+        """
+        dtype of the smoothing : dtype of X if it is a float array, else compute_dtype.
+        """
+        X = np.asarray(X)
+        if np.issubdtype(X.dtype, np.floating):
+            return X.dtype
+        return self.compute_dtype
+
+    def _get_band(self, X, in_band):
+        """
+        Return one band of X in float (only this band is copied), see :func:`_get_compute_dtype`.
+        """
+        return np.asarray(X[:, in_band], dtype=self._get_compute_dtype(X))
 
+    def _write_output(self, x, out_band, values):
+        """
+        Scale (and round for an integer output) values, then write them in x.
+        """
+        values = self._resize_if_flatten(np.asarray(values))
+        if self.output_scale == 1 and not np.issubdtype(x.dtype, np.integer):
+            x[:, out_band] = values
+            return
+        # values is a temporary array of one band, modified in place
+        if not np.issubdtype(values.dtype, np.floating):
+            values = values.astype(self.compute_dtype)
+        if self.output_scale != 1:
+            values *= self.output_scale
+        if np.issubdtype(x.dtype, np.integer):
+            info = np.iinfo(x.dtype)
+            np.rint(values, out=values)
+            np.clip(values, info.min, info.max, out=values)
+        x[:, out_band] = values
+
+    def _convert_date_to_integer(self, dates, fmt='%Y%m%d', convert_to_datetime=False, start_date=False):
         if start_date:
             if convert_to_datetime:
-                self.day0 = dt.datetime.strptime(str(start_date), fmt=fmt)
+                self.day0 = TimeAxis(start_date, fmt=fmt).to_datetime()[0]
             else:
                 self.day0 = start_date
         else:
-            self.day0 = dates[0]
-        dates_start_at_zero = [[date-self.day0][0].days for date in dates]
+            self.day0 = TimeAxis(dates, fmt=fmt).to_datetime()[0]
 
-        return dates_start_at_zero
+        return TimeAxis(dates, fmt=fmt).to_int(start_date=self.day0)
     
     def int_to_datetime(self, dates):
         """
@@ -454,78 +1281,705 @@ class SmoothSignal:
         Parameters
         -----------
         dates : list
-            List of int
+            List of int (positions in the output dates, can be fractional)
         """
-        datetimes = [self.day0+ dt.timedelta(self.output_dates_int[0]) + ( dt.timedelta(i) * self.output_deltadays ) for i in dates]
+        days = self._index_to_days(dates)
+        datetimes = [self.day0 + dt.timedelta(float(day)) for day in np.atleast_1d(days)]
         return datetimes
         
-    def convert_to_doy(self, dates, fmt='%Y%m%d'):
+    def index_to_date(self, idx, date_format='datetime64'):
         """
-        Convert list of dates to Day Of Year (DOY) number.
+        Convert indices (positions in the output dates, can be fractional) to dates.
         
         Parameters
         -----------
-        dates : list
-            List of dates
-        fmt : str
-            Format type of each date
-
+        idx : array
+            Indices, e.g. SOS or EOS from :func:`get_phenology_metrics`. nan are kept.
+        date_format : str, default 'datetime64'
+            'datetime64' for numpy datetime64 (second precision, NaT for nan),
+            'doy' for the (fractional) day of year,
+            'days' for the (fractional) number of days since the first input date.
         """
-        return [dt.datetime.strptime(str(date), fmt).timetuple().tm_yday for date in dates]
-    def convert_to_datetime(self, dates, fmt='%Y%m%d'):
+        return self.days_to_date(self._index_to_days(idx), date_format)
+    
+    def _index_to_days(self, idx):
         """
-        Convert list of dates to a list of dates with datetime type.
-
-        Parameters
-        -----------
-        dates : list
-            List of dates
-        fmt : str
-            Format type of each date
+        Days since the first input date of (fractional) positions in the output dates,
+        linearly extrapolated with the first and last steps outside of the output dates.
         """
-        return [dt.datetime.strptime(str(date), fmt) for date in dates]
-
-    def double_logistic(self, X, kind='cubic', interpolation_params={}):
+        idx = np.asarray(idx, dtype=np.float64)
+        output_dates_int = np.asarray(self.output_dates_int, dtype=np.float64)
+        days = np.interp(idx, np.arange(self.output_n_dates), output_dates_int)
+        if self.output_n_dates > 1:
+            last = self.output_n_dates - 1
+            days = np.where(idx < 0, output_dates_int[0] + idx * (output_dates_int[1] - output_dates_int[0]), days)
+            days = np.where(idx > last, output_dates_int[-1] + (idx - last) * (output_dates_int[-1] - output_dates_int[-2]), days)
+        return days
+    
+    def days_to_date(self, days, date_format='datetime64'):
         """
-        Generate a double logistic curve similar to those of the MODIS phenology product.
+        Convert (fractional) numbers of days since the first input date to dates.
         
         Parameters
-        ------------
-        X : array_like
-            A N-D array of real values. The length of y along the interpolation axis must be equal to the length of dates.
-        kind : str, default 'linear'
+        -----------
+        days : array
+            Days since the first input date, e.g. the inflection points of a fitted double logistic. nan are kept.
+        date_format : str, default 'datetime64'
+            See :func:`index_to_date`. 'index' returns the (fractional) position in the output dates.
+        """
+        days = np.asarray(days, dtype=np.float64)
+        if date_format == 'days':
+            return days
+        elif date_format == 'index':
+            idx = np.interp(days, self.output_dates_int, np.arange(self.output_n_dates))
+            idx[~np.isfinite(days)] = np.nan
+            return idx
+        
+        valid = np.isfinite(days)
+        seconds = np.zeros(days.shape, dtype='timedelta64[s]')
+        seconds[valid] = np.round(days[valid] * 86400).astype(np.int64)
+        datetimes = self.init_time_axis.dates[0].astype('datetime64[s]') + seconds
+        datetimes[~valid] = np.datetime64('NaT')
+        
+        if date_format == 'datetime64':
+            return datetimes
+        elif date_format == 'doy':
+            year_start = datetimes.astype('datetime64[Y]').astype('datetime64[s]')
+            doy = (datetimes - year_start).astype(np.float64) / 86400 + 1
+            doy[~valid] = np.nan
+            return doy
+        else:
+            raise ValueError('date_format must be \'datetime64\', \'doy\', \'days\' or \'index\'.')
+    
+    def get_phenology_metrics(self, X, sos=0.2, eos=0.8, min_from_year=False, metrics=['sos','eos'],
+                              fractional=True, date_format='doy'):
+        """
+        Phenology metrics of a series smoothed on the output dates, with dates
+        converted from the output dates.
+        
+        See :func:`get_phenology_metrics` for sos, eos, min_from_year and metrics.
+        Areas and rates use the number of days between output dates.
+        
+        Parameters
+        -----------
+        fractional : bool, default True
+            If True, SOS and EOS are interpolated between two output dates.
+        date_format : str, default 'doy'
+            'index' to keep positions in the output dates,
+            'doy' to convert sos, eos and peak_date to day of year,
+            'days' to convert them to days since the first input date.
+            With 'doy' or 'days', los is in days. For datetime64 dates, keep 'index'
+            and convert the columns with :func:`index_to_date`.
+        
+        Example
+        --------
+        >>> x_smooth = ts.savitzski_golay(x, window_length=9, polyorder=2)
+        >>> ts.get_phenology_metrics(x_smooth, metrics=['sos','eos','los'])
+        """
+        if date_format not in ['doy', 'days', 'index']:
+            raise ValueError('date_format must be \'doy\', \'days\' or \'index\'.')
+        # sos and eos are needed for los in days
+        all_metrics = list(metrics) + [metric for metric in ['sos', 'eos'] if metric not in metrics]
+        feats = get_phenology_metrics(
+            X, sos, eos, min_from_year, all_metrics, dates=self.output_dates_int, fractional=fractional)
+        
+        if date_format != 'index':
+            if 'los' in metrics:
+                days = self.index_to_date(
+                    feats[..., [all_metrics.index('sos'), all_metrics.index('eos')]], 'days')
+                feats[..., all_metrics.index('los')] = days[..., 1] - days[..., 0]
+            for metric in ['sos', 'eos', 'peak_date']:
+                if metric in metrics:
+                    column = all_metrics.index(metric)
+                    feats[..., column] = self.index_to_date(feats[..., column], date_format)
+        
+        return feats[..., :len(metrics)]
+    
+    def get_double_logistic_metrics(self, params, sos=0.2, eos=0.8, metrics=['sos', 'eos'], date_format='doy'):
+        """
+        Phenology metrics computed in closed form from the parameters of fitted double logistic curves.
+        
+        No dense curve is needed : SOS and EOS are the inversion of the logistic terms,
+        sos = x0 + x1*ln(sos/(1-sos)) and eos = x2 + x3*ln((1-eos)/eos).
+        
+        Parameters
+        -----------
+        params : array
+            Parameters of shape (n_pixels, 6), from :func:`double_logistic` with return_params=True.
+        sos : float or list, default 0.2
+            Percentage (0.2 for 20%) of the season amplitude. A list gives one column per thresold.
+        eos : float or list, default 0.8
+            Percentage (0.8 for 80%) of the season amplitude. A list gives one column per thresold.
+        metrics : list, default ['sos', 'eos']
+            Among 'sos', 'eos', 'los' (in days), 'amplitude' (A) and 'base' (B).
+        date_format : str, default 'doy'
+            'doy', 'days' or 'index', format of sos and eos (see :func:`days_to_date`).
+        
+        Returns
+        --------
+        feats : array
+            Array of shape (n_pixels, n_metrics), or (n_pixels, n_thresolds, n_metrics)
+            if sos or eos is a list.
+        
+        Example
+        --------
+        >>> x_dl, params = ts.double_logistic(x, method='LM', return_params=True)
+        >>> ts.get_double_logistic_metrics(params, metrics=['sos', 'eos', 'los'])
+        """
+        if date_format not in ['doy', 'days', 'index']:
+            raise ValueError('date_format must be \'doy\', \'days\' or \'index\'.')
+        params = np.atleast_2d(np.asarray(params, dtype=np.float64))
+        t_sos, t_eos = fun_dl.sos_eos_from_params(params, sos, eos)
+        t_sos, t_eos = np.broadcast_arrays(t_sos, t_eos)
+        
+        feats = np.empty(t_sos.shape + (len(metrics),))
+        for column, metric in enumerate(metrics):
+            if metric == 'sos':
+                feats[..., column] = self.days_to_date(t_sos, date_format)
+            elif metric == 'eos':
+                feats[..., column] = self.days_to_date(t_eos, date_format)
+            elif metric == 'los':
+                feats[..., column] = t_eos - t_sos
+            elif metric == 'amplitude':
+                feats[..., column] = params[:, [0]]
+            elif metric == 'base':
+                feats[..., column] = params[:, [1]]
+            else:
+                raise ValueError('{} is not available from the double logistic parameters.'.format(metric))
+        
+        if np.ndim(sos) == 0 and np.ndim(eos) == 0:
+            feats = feats[:, 0, :]
+        
+        return feats
+        
+    def convert_to_doy(self, dates, fmt='%Y%m%d'):
+        """
+        Convert list of dates to Day Of Year (DOY) number.
+        
+        Parameters
+        -----------
+        dates : list
+            List of dates
+        fmt : str
+            Format type of each date
+
+        """
+        return TimeAxis(dates, fmt=fmt).doy.tolist()
+    def convert_to_datetime(self, dates, fmt='%Y%m%d'):
+        """
+        Convert list of dates to a list of dates with datetime type.
+
+        Parameters
+        -----------
+        dates : list
+            List of dates
+        fmt : str
+            Format type of each date
+        """
+        return TimeAxis(dates, fmt=fmt).to_datetime()
+
+    @_deduplicate_rows
+    def double_logistic(self, X, kind='cubic', interpolation_params={}, method='L-BFGS-B', maxiter=100,
+                        init='data', random_state=0, warm_start=False, fit_on='output', n_jobs=1, chunk_size=64,
+                        return_params=False, diagnostics=False, time_budget=None, iteration_budget=None,
+                        fallback_params={'window_length': 5, 'polyorder': 2}):
+        """
+        Generate a double logistic curve similar to those of the MODIS phenology product.
+        
+        Parameters
+        ------------
+        X : array_like
+            A N-D array of real values. The length of y along the interpolation axis must be equal to the length of dates.
+        kind : str, default 'linear'
             Specifies the kind of interpolation as a string ('linear', 'nearest', 'zero', 'slinear', 'quadratic', 'cubic', 'previous', 'next', where 'zero', 'slinear', 'quadratic' and 'cubic' refer to a spline interpolation of zeroth, first, second or third order; 'previous' and 'next' simply return the previous or next value of the point) or as an integer specifying the order of the spline interpolator to use. Default is 'linear'.
+        method : str, default 'L-BFGS-B'
+            If 'L-BFGS-B', each pixel is fitted with :func:`scipy.optimize.minimize`.
+            If 'LM', all pixels are fitted at once with a batched Levenberg-Marquardt,
+            each pixel stopping as soon as it has converged.
+        maxiter : int, default 100
+            Maximum number of iterations per pixel.
+        init : str or array_like, default 'data'
+            If 'data', initial parameters are computed from each pixel (amplitude, minimum, dates of half amplitude before and after the peak).
+            If 'random', [0,1,75,8,250,1] plus a random value drawn with random_state.
+            If array, initial parameters of shape (6,) or (n_pixels, 6), e.g. the solution of a previous block.
+        random_state : int, default 0
+            Seed used when init is 'random'.
+        warm_start : bool, default False
+            If True, a pixel starts from the solution of its neighbour (previous pixel with 'L-BFGS-B',
+            median solution of the previous call with 'LM') when it fits the pixel better than its own initial parameters.
+        fit_on : str, default 'output'
+            If 'output', X is first interpolated on the output dates and the curve is fitted on this interpolation.
+            If 'input', the curve is fitted on the original acquisition dates and values, then evaluated on the output dates.
+        n_jobs : int, default 1
+            Number of processes used to fit the pixels. -1 to use every core.
+        chunk_size : int, default 64
+            Number of pixels sent at once to a process. Chunks are handed out
+            dynamically to the first available process.
+        return_params : bool, default False
+            If True, also return the fitted parameters (A, B, x0, x1, x2, x3) of shape (n_pixels, 6),
+            e.g. for :func:`get_double_logistic_metrics`.
+        diagnostics : bool or str, default False
+            If True, also return the diagnostics of the fit (see :func:`get_fit_diagnostics`).
+            If 'bands', the diagnostics are added as extra columns after the output dates
+            (see :attr:`FIT_DIAGNOSTICS`), e.g. to write them in a raster. They are not scaled
+            by output_scale, and an integer output dtype is refused as it would truncate them.
+        time_budget : float or None, default None
+            Maximum number of seconds spent to fit X. Pixels which are not fitted or not converged
+            when the budget runs out keep their initial parameters.
+        iteration_budget : int or None, default None
+            Maximum number of iterations summed over all the pixels of X, never exceeded
+            (with n_jobs, each chunk gets a share of the budget proportional to its number of pixels).
+        fallback_params : dict, default {'window_length': 5, 'polyorder': 2}
+            When a budget is given, pixels which have not converged are replaced by a Savitzski-Golay
+            filter of these parameters (on the fitted dates) and flagged in the 'fallback' diagnostic.
 
         """
+        if isinstance(init, str) and init not in ['data', 'random']:
+            raise ValueError('init must be \'data\', \'random\' or an array of parameters.')
+        if isinstance(init, str) and init == 'random':
+            init = np.asarray([0.0, 1.0, 75.0, 8.0, 250.0, 1.0]) + 10*np.random.RandomState(random_state).rand(6)
+        
+        def fit(X, time_samples, params, deadline, iteration_budget):
+            previous = self._warm_params if warm_start else None
+            if n_jobs == 1 and self._pool is None:
+                fitted, n_iter, converged = _fit_double_logistic(
+                    X, time_samples, params, method=method, maxiter=maxiter,
+                    warm_start=warm_start, previous=previous, deadline=deadline, iteration_budget=iteration_budget)
+            else:
+                pool = self._get_pool(n_jobs, time_samples, method, maxiter, warm_start)
+                # the iteration budget is shared between chunks according to their size
+                chunks = ((start, X[start:start+chunk_size, :], params[start:start+chunk_size, :], previous, deadline,
+                           None if iteration_budget is None else
+                           iteration_budget * X[start:start+chunk_size, :].shape[0] / X.shape[0])
+                          for start in range(0, X.shape[0], chunk_size))
+                fitted = np.empty((X.shape[0], 6))
+                n_iter = np.empty(X.shape[0], dtype=np.int64)
+                converged = np.empty(X.shape[0], dtype=bool)
+                for start, (chunk_fitted, chunk_n_iter, chunk_converged) in pool.imap_unordered(
+                        _fit_double_logistic_chunk, chunks):
+                    stop = start + chunk_fitted.shape[0]
+                    fitted[start:stop, :] = chunk_fitted
+                    n_iter[start:stop] = chunk_n_iter
+                    converged[start:stop] = chunk_converged
+                if self._keep_pool is False:
+                    self._close_pool()
+            
+            if warm_start:
+                self._warm_params = np.median(fitted, axis=0)
+            return fitted, n_iter, converged
+        
+        return self._fit(
+            X, 'double_logistic', fit, kind, interpolation_params, init, fit_on, return_params,
+            diagnostics, time_budget, iteration_budget, fallback_params)
+
+    @_deduplicate_rows
+    def fit_model(self, X, model='double_logistic', kind='cubic', interpolation_params={}, maxiter=100,
+                  init='data', fit_on='output', return_params=False, diagnostics=False, time_budget=None,
+                  iteration_budget=None, fallback_params={'window_length': 5, 'polyorder': 2}):
+        """
+        Fit a phenology model on every pixel at once with a batched Levenberg-Marquardt.
+        
+        Available models are :
+            
+            - 'logistic' : A/(1+exp((x0-t)/x1)) + B
+            - 'double_logistic' : A*(1/(1+exp((x0-t)/x1)) - 1/(1+exp((x2-t)/x3))) + B, model of Beck et al. (2006)
+            - 'asymmetric_gaussian' : A*exp(-((t-x0)/w)**2) + B, with w=x1 before x0 and w=x2 after x0 (TIMESAT)
+            - 'elmore' : m1 + (m2-m7*t)*(1/(1+exp((m3-t)/m4)) - 1/(1+exp((m5-t)/m6))), model of Elmore et al. (2012)
+        
+        t is the number of days since the first input date.
+        
+        Parameters
+        ------------
+        X : array_like
+            A N-D array of real values. The length of y along the interpolation axis must be equal to the length of dates.
+        model : str, default 'double_logistic'
+            Name of the model, see above.
+        kind : str, default 'cubic'
+            Kind of interpolation on the output dates when fit_on is 'output', see :func:`interpolation`.
+        maxiter : int, default 100
+            Maximum number of iterations per pixel.
+        init : str or array_like, default 'data'
+            If 'data', initial parameters are computed from each pixel.
+            If array, initial parameters of shape (n_params,) or (n_pixels, n_params).
+        fit_on : str, default 'output'
+            If 'output', X is first interpolated on the output dates and the model is fitted on this interpolation.
+            If 'input', the model is fitted on the original acquisition dates and values, then evaluated on the output dates.
+        return_params : bool, default False
+            If True, also return the fitted parameters of shape (n_pixels, n_params).
+        diagnostics : bool or str, default False
+            See :func:`double_logistic`.
+        time_budget, iteration_budget, fallback_params :
+            See :func:`double_logistic`.
+        
+        Example
+        --------
+        >>> x_elmore = ts.fit_model(x, model='elmore')
+        """
+        def fit(X, time_samples, params, deadline, iteration_budget):
+            return fun_models.fit(
+                model, params, time_samples, X, maxiter=maxiter, deadline=deadline, iteration_budget=iteration_budget)
+        
+        return self._fit(
+            X, model, fit, kind, interpolation_params, init, fit_on, return_params,
+            diagnostics, time_budget, iteration_budget, fallback_params)
+    
+    def _fit(self, X, model, fit, kind, interpolation_params, init, fit_on, return_params, diagnostics,
+             time_budget, iteration_budget, fallback_params):
+        """
+        Pipeline shared by the curve fits : samples and dates to fit, initial parameters,
+        fit, evaluation on the output dates, fallback and diagnostics.
+        
+        fit(X, time_samples, params, deadline, iteration_budget) returns the fitted parameters,
+        the number of iterations and the convergence flag of each pixel.
+        """
+        model = fun_models.get_model(model)
         x = self._get_empty_output_array(X)
+        if diagnostics == 'bands' and np.issubdtype(x.dtype, np.integer):
+            raise ValueError('diagnostics=\'bands\' needs a float output dtype, not {}.'.format(x.dtype))
         X = self._resize_if_flatten(X)
-        if X.ndim == 2:    
-            if X.shape[-1] != self.output_dates_int:
-                X = self.interpolation(X,kind=kind,**interpolation_params)
-        else:
+        if X.ndim != 2:
             raise ValueError('X array must be of shape [2,-1].')
         
-        params = np.asarray([0.0, 1.0, 75.0, 8.0, 250.0, 1.0])+ 10*np.random.rand(6)
-        for n_row in range(X.shape[0]):
-            
-            increase_max = 100
-        
-            solver = fun_dl.minimize(fun_dl.cost_function,
-                              params,
-                              args=(np.asarray(self.output_dates_int), X[n_row,:]),
-                              method='L-BFGS-B',
-                              jac=fun_dl.cost_function_grad,                                 
-                              options={'gtol': 1e-10,
-                                       'ftol': 1e-10,
-                                       'maxiter':increase_max,
-                                       'maxcor':increase_max,
-                                       'maxfun':increase_max,
-                                       'maxls':1000})
-                
-            x[n_row,:] = fun_dl.double_logistique(solver.x, np.asarray(self.output_dates_int))
-                
-        return x
+        if fit_on == 'output':
+            if not self._is_on_output_dates(X):
+                X = self._interpolate(X, kind=kind, **interpolation_params)
+            time_samples = np.asarray(self.output_dates_int)
+        elif fit_on == 'input':
+            if X.shape[-1] != self.init_n_dates:
+                raise ValueError('X must have as many columns as input dates to be fitted on them.')
+            time_samples = np.asarray(self.init_dates_int)
+        else:
+            raise ValueError('fit_on must be \'output\' or \'input\'.')
         
+        if isinstance(init, str):
+            if init != 'data':
+                raise ValueError('init must be \'data\' or an array of parameters.')
+            params = model['initial_parameters'](time_samples, X)
+        else:
+            params = init
+        params = np.array(np.broadcast_to(params, (X.shape[0], len(model['params']))), dtype=np.float64)
+        
+        start_time = time.perf_counter()
+        deadline = None if time_budget is None else time.time() + time_budget
+        fitted, n_iter, converged = fit(X, time_samples, params, deadline, iteration_budget)
+        
+        values = model['kernel'](fitted, np.asarray(self.output_dates_int), jacobian=False)[0]
+        fallback = self._fit_fallback(
+            X, fit_on, values, converged, time_budget is not None or iteration_budget is not None, fallback_params)
+        self._write_output(x, slice(None), values)
+        
+        fit_diagnostics = self.get_fit_diagnostics(
+            X, time_samples, fitted, n_iter, converged, time.perf_counter() - start_time, model['kernel'],
+            fallback)
+        
+        return self._return_fit(x, fitted, fit_diagnostics, return_params, diagnostics)
+    
+    def _fit_fallback(self, X, fit_on, values, converged, budget, fallback_params):
+        """
+        Replace in values the pixels which have not converged by a Savitzski-Golay filter of X.
+        
+        Returns the flag of the replaced pixels.
+        """
+        fallback = np.zeros(X.shape[0], dtype=bool)
+        if budget:
+            fallback = ~converged
+        if fallback.any():
+            X_fallback = X[fallback]
+            if fit_on == 'input':
+                X_fallback = self._interpolate(X_fallback)
+            values[fallback] = signal.savgol_filter(X_fallback, axis=1, **fallback_params)
+        return fallback
+    
+    def get_fit_diagnostics(self, X, time_samples, fitted, n_iter, converged, elapsed,
+                            kernel=fun_dl.double_logistique_fused, fallback=None):
+        """
+        Per-pixel and block diagnostics of a fit.
+        
+        The block statistics are also appended to :attr:`fit_statistics`.
+        
+        Returns
+        --------
+        diagnostics : dict
+            'rmse', 'n_iter', 'converged', 'fallback' (one value per pixel), 'params' (n_pixels, n_params),
+            'time' (seconds spent to fit the block) and 'pixels_per_second'.
+        """
+        if fallback is None:
+            fallback = np.zeros(X.shape[0], dtype=bool)
+        _, residual, _ = kernel(fitted, np.asarray(time_samples, dtype=np.float64), X, jacobian=False)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            rmse = np.sqrt(np.nanmean(residual**2, axis=1))
+        
+        fit_diagnostics = dict(
+            rmse=rmse, n_iter=n_iter, converged=converged, fallback=fallback, params=fitted,
+            time=elapsed, pixels_per_second=X.shape[0] / elapsed if elapsed > 0 else np.inf)
+        self.fit_statistics.append(dict(
+            n_pixels=X.shape[0], time=elapsed, pixels_per_second=fit_diagnostics['pixels_per_second'],
+            mean_iter=float(np.mean(n_iter)) if n_iter.size else 0.,
+            converged_rate=float(np.mean(converged)) if converged.size else 1.,
+            n_fallback=int(np.sum(fallback))))
+        
+        return fit_diagnostics
+    
+    def _return_fit(self, x, fitted, fit_diagnostics, return_params, diagnostics):
+        if diagnostics == 'bands':
+            x = np.hstack((x, _fit_diagnostics_to_array(fit_diagnostics).astype(x.dtype)))
+        
+        output = (x,)
+        if return_params:
+            output += (fitted,)
+        if diagnostics is True:
+            output += (fit_diagnostics,)
+        
+        return output[0] if len(output) == 1 else output
+
+    def _get_pool(self, n_jobs, time_samples, method, maxiter, warm_start):
+        """
+        Return a pool of processes which already know the dates and the model.
+
+        The pool is reused as long as the dates and the model do not change.
+        """
+        pool_key = (tuple(time_samples), method, maxiter, warm_start)
+        if self._pool is not None and self._pool_key != pool_key:
+            self._close_pool()
+        if self._pool is None:
+            if n_jobs == -1:
+                n_jobs = multiprocessing.cpu_count()
+            self._pool = multiprocessing.Pool(
+                n_jobs,
+                initializer=_init_fit_worker,
+                initargs=(time_samples, method, maxiter, warm_start))
+            self._pool_key = pool_key
+        return self._pool
+
+    def _close_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+        self._pool = None
+        self._pool_key = None
+
+    def double_logistic_raster(self, input_raster, output_raster, n_jobs=1, dtype=np.float32, diagnostics=False,
+                               **params):
+        """
+        Generate a double logistic raster from a raster time series.
+
+        The same pool of processes is used for every block of the raster.
+
+        Parameters
+        -----------
+        intput_raster : path
+            path of the raster file.
+        output_raster : path
+            path to save the raster file. (e.g. '/tmp/myDoubleLogistic.tif')
+        n_jobs : int, default 1
+            Number of processes used to fit the pixels. -1 to use every core.
+        dtype : numpy dtype, default np.float32
+            dtype of the output
+        diagnostics : bool, default False
+            If True, rmse, number of iterations, convergence and fallback flags and the 6 parameters of each pixel
+            are written as extra bands after the output dates, and the time spent and the throughput
+            of the fit are written in the metadata. Needs a float dtype.
+        **params :
+            Parameters given to :func:`SmoothSignal.double_logistic`.
+
+        Example
+        --------
+        >>> ts.double_logistic_raster(raster,'/tmp/my_dl.tif',n_jobs=4,method='LM',diagnostics=True)
+        """
+        if diagnostics and np.issubdtype(dtype, np.integer):
+            raise ValueError('diagnostics needs a float dtype, not {}.'.format(np.dtype(dtype)))
+        from museotoolbox.processing import RasterMath
+
+        n_blocks = len(self.fit_statistics)
+        rM = RasterMath(input_raster, message='Fitting double logistic')
+        rM.add_function(
+            self.double_logistic,
+            output_raster,
+            out_np_dt=dtype,
+            n_jobs=n_jobs,
+            diagnostics='bands' if diagnostics else False,
+            **params)
+        self._keep_pool = True
+        try:
+            rM.run()
+        finally:
+            self._keep_pool = False
+            self._close_pool()
+        self.set_description_metadata(output_raster)
+        if diagnostics:
+            self._set_fit_diagnostics_metadata(
+                output_raster, fun_models.MODELS['double_logistic']['params'], self.fit_statistics[n_blocks:])
+
+    def _set_fit_diagnostics_metadata(self, output_raster, params_names, fit_statistics):
+        """
+        Name the diagnostics bands and write the timing of the fit in the metadata.
+        """
+        import gdal
+
+        ds = gdal.Open(output_raster, gdal.GA_Update)
+        names = FIT_DIAGNOSTICS + list(params_names)
+        for idx, name in enumerate(names):
+            ds.GetRasterBand(ds.RasterCount - len(names) + idx + 1).SetDescription(name)
+        
+        total_time = sum(block['time'] for block in fit_statistics)
+        n_pixels = sum(block['n_pixels'] for block in fit_statistics)
+        ds.SetMetadataItem('fit_time', str(total_time), 'FIT')
+        ds.SetMetadataItem('fit_pixels', str(n_pixels), 'FIT')
+        if total_time > 0:
+            ds.SetMetadataItem('fit_pixels_per_second', str(n_pixels / total_time), 'FIT')
+        ds.FlushCache()
+        ds = None
+
+    def generate_raster(self, input_raster, output_raster, method='savitzski_golay', n_jobs=1,
+                        dtype=False, bands_names=False, **params):
+        """
+        Smooth a whole raster time series and save it in a new raster.
+
+        The raster is read block per block, blocks are processed in parallel
+        and the output dates are written in the metadata of the new raster.
+
+        Parameters
+        -----------
+        intput_raster : path
+            path of the raster file.
+        output_raster : path
+            path to save the raster file. (e.g. '/tmp/mySmoothedSITS.tif')
+        method : str, default 'savitzski_golay'
+            Name of the SmoothSignal method used for each block (e.g. 'interpolation', 'iterative_median', 'double_logistic', 'fit_model').
+        n_jobs : int, default 1
+            Number of blocks processed at the same time. -1 to use every core.
+        dtype : numpy dtype or False, default False
+            dtype of the output. If False, same as the smoothed array.
+        bands_names : list or False, default False
+            Names of the bands written in the metadata (e.g. ['NDVI']).
+        **params :
+            Parameters given to the method.
+
+        Example
+        --------
+        >>> ts.generate_raster(raster,'/tmp/my_smoothed_sits.tif',method='savitzski_golay',n_jobs=4,window_length=9,polyorder=2)
+        """
+        from museotoolbox.processing import RasterMath
+
+        function = getattr(self, method)
+
+        rM = RasterMath(input_raster, n_jobs=n_jobs, message='Smoothing time series')
+        rM.add_function(
+            function,
+            output_raster,
+            out_np_dt=dtype,
+            **params)
+        rM.run()
+        self.set_description_metadata(output_raster, bands_names=bands_names)
+
+    def generate_coefficients_raster(self, input_raster, output_raster, model='harmonic', n_jobs=1,
+                                     dtype=np.float32, **params):
+        """
+        Save the coefficients of a model fitted on each pixel instead of the smoothed series.
+        
+        The model, its parameters and the time axis are written in the 'COEFFICIENTS' metadata
+        domain, so :class:`CoefficientsRaster` can evaluate the series at any date.
+        
+        Parameters
+        -----------
+        input_raster : path
+            path of the raster time series.
+        output_raster : path
+            path to save the coefficients raster. (e.g. '/tmp/harmonic_coefficients.tif')
+        model : str, default 'harmonic'
+            'harmonic' for :func:`harmonic` (mean, amplitudes then phases of each band),
+            or a model of :func:`fit_model` (e.g. 'double_logistic', one band only).
+        n_jobs : int, default 1
+            Number of blocks processed at the same time. -1 to use every core.
+        dtype : numpy dtype, default np.float32
+            dtype of the output
+        **params :
+            Parameters given to :func:`harmonic` or :func:`fit_model`.
+        
+        Example
+        --------
+        >>> ts.generate_coefficients_raster(raster, '/tmp/coefs.tif', model='harmonic', n_harmonics=3)
+        >>> CoefficientsRaster('/tmp/coefs.tif').generate_raster('/tmp/daily.tif', generate_temporal_sampling(20180429, 20181115, 1))
+        """
+        if model == 'harmonic':
+            n_harmonics = params.get('n_harmonics', 2)
+            names = ['mean'] + ['amplitude_{}'.format(k) for k in range(1, n_harmonics + 1)] + \
+                ['phase_{}'.format(k) for k in range(1, n_harmonics + 1)]
+            n_bands = len(self.bands_order) if self.bands_order is not False else 1
+        else:
+            if self.bands_order is not False and len(self.bands_order) > 1:
+                raise ValueError('Model {} fits one band only, but bands_order has {} bands.'.format(
+                    model, len(self.bands_order)))
+            names = fun_models.get_model(model)['params']
+            n_bands = 1
+        
+        import gdal
+        from museotoolbox.processing import RasterMath
+        
+        rM = RasterMath(input_raster, n_jobs=n_jobs, message='Computing coefficients')
+        rM.add_function(
+            _compute_coefficients_block,
+            output_raster,
+            out_np_dt=dtype,
+            smooth_signal=self,
+            model=model,
+            params=params)
+        rM.run()
+        
+        ds = gdal.Open(output_raster, gdal.GA_Update)
+        for band in range(n_bands):
+            band_name = str(self.bands_order[band]) + ' - ' if n_bands > 1 else ''
+            for idx, name in enumerate(names):
+                ds.GetRasterBand(band * len(names) + idx + 1).SetDescription(band_name + name)
+        metadata = dict(
+            model=model,
+            n_bands=str(n_bands),
+            order_by=self.order_by,
+            day0=str(np.datetime64(self.day0, 'D')),
+            output_dates=','.join(str(date) for date in self.output_time_axis.to_yyyymmdd()))
+        if model == 'harmonic':
+            metadata['period'] = str(params.get('period', 365))
+            metadata['n_harmonics'] = str(params.get('n_harmonics', 2))
+        for key, value in metadata.items():
+            ds.SetMetadataItem(key, value, 'COEFFICIENTS')
+        ds.FlushCache()
+        ds = None
+
+    def set_description_metadata(self, input_raster, bands_names=False):
+        """
+        Write metadata (band and output date) in raster.
+
+        Based on :func:`museopheno.sensors.SensorManager.set_description_metadata`.
+
+        Parameters
+        -----------
+        input_raster : str.
+            Path of the raster to write in the metadata each band number and date.
+        bands_names : list or False, default False
+            Names of the bands (e.g. ['NDVI']).
+        """
+        from museopheno.sensors import SensorManager
+
+        if self.bands_order is not False:
+            bands_order = [str(band) for band in self.bands_order]
+        elif bands_names is not False:
+            bands_order = list(bands_names)
+        else:
+            bands_order = ['1']
+
+        sensor = SensorManager(bands_order, bands_names=bands_names)
+        sensor.configure_bands_order(self.order_by)
+        sensor.set_description_metadata(input_raster, self.output_dates)
+
+    def __getstate__(self):
+        # a pool of processes can not be sent to another process
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        state['_pool_key'] = None
+        return state
+        
+    @_deduplicate_rows
     def interpolation(self, X, kind='linear', fill_value='extrapolate', **params):
         """
         Based on :class:`scipy.interpolate.interp1d`
@@ -547,29 +2001,50 @@ class SmoothSignal:
         x = self._get_empty_output_array(X)
         X = self._resize_if_flatten(X)
         for in_band, out_band in self._get_time_series_position_per_band(X):
-            tmp = interpolate.interp1d(
-                self.init_dates_int, X[:, in_band], kind=kind, **params)
-            x[:, out_band] = self._resize_if_flatten(tmp(self.output_dates_int))
+            self._write_output(x, out_band, self._interpolate(
+                X[:, in_band], kind=kind, **params))
         return (x)
 
-    def iterative_median(self, X, window_length=3, interpolation_params={}, **params):
+    def _interpolate(self, X, **params):
         """
-        Savitzski golay 
-        Based on :class:`scipy.signal.median_filter`
+        Interpolate one band on the output dates, in float (see :func:`_get_compute_dtype`).
+        """
+        tmp = interpolate.interp1d(
+            self.init_dates_int, np.asarray(X, dtype=self._get_compute_dtype(X)), **params)
+        return self._resize_if_flatten(tmp(self.output_dates_int))
+
+    @_deduplicate_rows
+    def iterative_median(self, X, window_length=3, n_iter=10, interpolation_params={}, **params):
+        """
+        Iterative median filter along the time axis.
+
+        Each pixel is filtered independently (neighbouring pixels are never mixed)
+        and the median filter is applied again until the signal does not change
+        anymore or until n_iter is reached.
+
+        Parameters
+        -----------
+        X : array_like
+            A N-D array of real values. The length of y along the interpolation axis must be equal to the length of dates.
+        window_length : int, default 3
+            Number of dates in the moving window.
+        n_iter : int, default 10
+            Maximum number of median filter passes.
+        interpolation_params : dict, default {}
+            Parameters given to :class:`scipy.interpolate.interp1d`.
 
         References
         ----------
-        :class:`scipy.signal.savgol_filter`
+        :class:`scipy.ndimage.median_filter`
         """
         x = self._get_empty_output_array(X)
         X = self._resize_if_flatten(X)
         for in_band, out_band in self._get_time_series_position_per_band(X):
-            tmp = interpolate.interp1d(
-                self.init_dates_int, X[:, in_band], **interpolation_params)
-            x[:, out_band] = self._resize_if_flatten(median_filter(
-                tmp(self.output_dates_int), size = window_length))
+            self._write_output(x, out_band, _iterative_rolling_median(
+                self._interpolate(X[:, in_band], **interpolation_params), window_length, n_iter))
         return x
 
+    @_deduplicate_rows
     def savitzski_golay(self, X, window_length=3, polyorder=1, interpolation_params={}, **params):
         """
         Savitzski golay 
@@ -582,14 +2057,239 @@ class SmoothSignal:
         x = self._get_empty_output_array(X)
         X = self._resize_if_flatten(X)
         for in_band, out_band in self._get_time_series_position_per_band(X):
-            tmp = interpolate.interp1d(
-                self.init_dates_int, X[:, in_band], **interpolation_params)
-            x[:, out_band] = self._resize_if_flatten(signal.savgol_filter(
-                tmp(self.output_dates_int), window_length, polyorder, **params))
+            self._write_output(x, out_band, signal.savgol_filter(
+                self._interpolate(X[:, in_band], **interpolation_params), window_length, polyorder, **params))
         return x
 
+    @_deduplicate_rows
+    def savitzski_golay_irregular(self, X, window_length=5, polyorder=2):
+        """
+        Savitzski golay on the irregular acquisition dates.
+
+        For each output date, a polynomial is fitted by least squares on the
+        window_length nearest acquisitions. The weights only depend on the dates,
+        so they are computed once as a sparse matrix and each block is smoothed
+        with a single sparse product, without any interpolation.
+
+        Parameters
+        -----------
+        X : array_like
+            A N-D array of real values. The length of y along the interpolation axis must be equal to the length of dates.
+        window_length : int, default 5
+            Number of acquisitions used for each output date.
+        polyorder : int, default 2
+            Order of the polynomial. Must be less than window_length.
 
-def generate_temporal_sampling(start_date, last_date, day_interval=5, save_csv=False, fmt='%Y%m%d'):
+        References
+        ----------
+        :class:`scipy.signal.savgol_filter`
+        """
+        key = (window_length, polyorder)
+        if key not in self._local_polynomial_weights:
+            self._local_polynomial_weights[key] = _local_polynomial_weights(
+                self.init_dates_int, self.output_dates_int, window_length, polyorder)
+        weights = self._local_polynomial_weights[key]
+
+        x = self._get_empty_output_array(X)
+        X = self._resize_if_flatten(X)
+        for in_band, out_band in self._get_time_series_position_per_band(X):
+            self._write_output(x, out_band, weights.dot(self._get_band(X, in_band).T).T)
+        return x
+
+    def get_incremental_state(self, X, window_length=5, polyorder=2):
+        """
+        Compact state of each pixel to update :func:`savitzski_golay_irregular` with new acquisitions.
+        
+        Only the last 2*window_length acquisitions are kept : the window of an output date
+        never goes further back once new acquisitions arrive after the last one.
+        
+        Parameters
+        -----------
+        X : array_like
+            Array of one band, with as many columns as input dates.
+        window_length : int, default 5
+            Number of acquisitions used for each output date.
+        polyorder : int, default 2
+            Order of the polynomial. Must be less than window_length.
+        
+        Returns
+        --------
+        state : dict
+            'X' the last acquisitions, 'dates_int' their number of days since the first input date,
+            'window_length' and 'polyorder'.
+        
+        Example
+        --------
+        >>> x = ts.savitzski_golay_irregular(X, window_length=5, polyorder=2)
+        >>> state = ts.get_incremental_state(X, window_length=5, polyorder=2)
+        >>> start, values, state = ts.update_incremental(state, X_new, [20181125])
+        >>> x[:, start:] = values
+        """
+        X = self._resize_if_flatten(X)
+        if self.bands_order is not False and len(self.bands_order) > 1:
+            raise ValueError('Incremental smoothing works on one band only.')
+        if X.shape[1] != self.init_n_dates:
+            raise ValueError('X must have as many columns as input dates.')
+        if window_length > self.init_n_dates:
+            raise ValueError('window_length must be less than or equal to the number of dates.')
+        
+        n_kept = min(2 * window_length, self.init_n_dates)
+        return dict(
+            X=np.array(X[:, -n_kept:], dtype=self._get_compute_dtype(X)),
+            dates_int=np.asarray(self.init_dates_int[-n_kept:], dtype=np.int64),
+            window_length=window_length,
+            polyorder=polyorder)
+    
+    def update_incremental(self, state, X_new, new_dates, fmt='%Y%m%d'):
+        """
+        Update the output of :func:`savitzski_golay_irregular` with new acquisitions.
+        
+        Only output dates after the window_length-th last acquisition of the state can change,
+        so only these ones are computed, from the state and the new acquisitions.
+        
+        Parameters
+        -----------
+        state : dict
+            State from :func:`get_incremental_state` or from a previous update.
+        X_new : array_like
+            New acquisitions, one column per new date.
+        new_dates : list
+            Dates of the new acquisitions, after the last date of the state.
+        fmt : str, default '%Y%m%d'
+            Format of new_dates.
+        
+        Returns
+        --------
+        start : int
+            Index of the first output date which has been computed again.
+        values : array
+            New values of the output dates from start, of shape (n_pixels, n_output_dates - start).
+        state : dict
+            State including the new acquisitions.
+        """
+        X_new = self._resize_if_flatten(np.asarray(X_new))
+        new_dates_int = TimeAxis(new_dates, fmt=fmt).to_int(np.datetime64(self.day0, 'D'))
+        if X_new.shape[1] != new_dates_int.size:
+            raise ValueError('X_new must have one column per new date.')
+        if np.any(np.diff(np.concatenate((state['dates_int'][-1:], new_dates_int))) <= 0):
+            raise ValueError('New dates must be sorted and after the last date of the state.')
+        
+        window_length = state['window_length']
+        dates_int = np.concatenate((state['dates_int'], new_dates_int))
+        X = np.hstack((state['X'], np.asarray(X_new, dtype=state['X'].dtype)))
+        
+        # output dates whose window can include a new acquisition
+        output_dates_int = np.asarray(self.output_dates_int)
+        start = int(np.searchsorted(output_dates_int, state['dates_int'][-window_length]))
+        weights = _local_polynomial_weights(
+            dates_int, output_dates_int[start:], window_length, state['polyorder'])
+        
+        values = np.empty((X.shape[0], output_dates_int.size - start), self._get_output_dtype(X_new))
+        self._write_output(values, slice(None), weights.dot(X.T).T)
+        
+        n_kept = 2 * window_length
+        new_state = dict(state, X=X[:, -n_kept:], dates_int=dates_int[-n_kept:])
+        
+        return start, values, new_state
+
+    def _get_harmonic_matrices(self, n_harmonics, period):
+        """
+        Design matrices on input and output dates and pseudo-inverse of the
+        input design matrix, computed once per number of harmonics and period.
+        """
+        key = (n_harmonics, period)
+        if key not in self._harmonic_matrices:
+            design = _harmonic_design_matrix(self.init_dates_int, n_harmonics, period)
+            self._harmonic_matrices[key] = (
+                design,
+                np.linalg.pinv(design),
+                _harmonic_design_matrix(self.output_dates_int, n_harmonics, period))
+        return self._harmonic_matrices[key]
+
+    @_deduplicate_rows
+    def harmonic(self, X, n_harmonics=2, period=365, hants_iter=0, tolerance=0,
+                 reject='low', min_points=False, return_coefficients=False):
+        """
+        Harmonic (Fourier) regression of each time series, with an optional
+        outlier rejection as in HANTS (Harmonic ANalysis of Time Series).
+
+        The design matrix only depends on the input dates, so its
+        pseudo-inverse is computed once and each block is fitted with a
+        single matrix product.
+
+        Parameters
+        -----------
+        X : array_like
+            A N-D array of real values. The length of y along the interpolation axis must be equal to the length of dates.
+        n_harmonics : int, default 2
+            Number of harmonics (frequencies period, period/2...).
+        period : int or float, default 365
+            Base period in days.
+        hants_iter : int, default 0
+            Maximum number of outlier rejections per pixel. At each iteration,
+            the worst point of each pixel whose residual is above tolerance is discarded
+            and only these pixels are fitted again.
+        tolerance : float, default 0
+            Fit error tolerance, a point is rejected only if its residual is above this value.
+        reject : str, default 'low'
+            'low' to reject points below the curve (e.g. clouds on a vegetation index),
+            'high' to reject points above the curve, 'both' for the absolute residual.
+        min_points : int or False, default False
+            Minimum number of points kept per pixel. If False, 2*n_harmonics+2.
+        return_coefficients : bool, default False
+            If True, returns the coefficients instead of the smoothed series :
+            mean, amplitudes of each harmonic then phases (radians) of each harmonic,
+            for each band.
+
+        References
+        ----------
+        Roerink, G. J., Menenti, M., & Verhoef, W. (2000). Reconstructing cloudfree NDVI composites using Fourier analysis of time series. International Journal of Remote Sensing, 21(9), 1911-1917.
+        """
+        design, design_pinv, output_design = self._get_harmonic_matrices(n_harmonics, period)
+        n_coefs = design.shape[1]
+        if min_points is False:
+            min_points = n_coefs + 1
+
+        if return_coefficients:
+            x = np.empty((self._resize_if_flatten(X).shape[0], 0))
+        else:
+            x = self._get_empty_output_array(X)
+        X = self._resize_if_flatten(X)
+        for in_band, out_band in self._get_time_series_position_per_band(X):
+            Y = self._get_band(X, in_band)
+            coefs = Y @ design_pinv.T
+
+            weights = np.ones(Y.shape, dtype=bool)
+            for _ in range(hants_iter):
+                residual = Y - coefs @ design.T
+                if reject == 'low':
+                    residual = -residual
+                elif reject == 'both':
+                    residual = np.abs(residual)
+                residual[~weights] = -np.inf
+
+                worst = residual.argmax(axis=1)
+                rows = np.flatnonzero(np.logical_and(
+                    residual[np.arange(Y.shape[0]), worst] > tolerance,
+                    weights.sum(axis=1) > min_points))
+                if rows.size == 0:
+                    break
+                weights[rows, worst[rows]] = False
+
+                # weighted least squares only for pixels which lost a point
+                w = weights[rows].astype(np.float64)
+                lhs = np.einsum('dp,nd,dq->npq', design, w, design)
+                rhs = np.einsum('dp,nd->np', design, w * Y[rows])
+                coefs[rows] = np.linalg.solve(lhs, rhs[..., np.newaxis])[..., 0]
+
+            if return_coefficients:
+                x = np.hstack((x, _harmonic_coefficients_to_amplitude_phase(coefs)))
+            else:
+                self._write_output(x, out_band, coefs @ output_design.T)
+        return x
+
+
+def generate_temporal_sampling(start_date, last_date, day_interval=5, save_csv=False, fmt='%Y%m%d', unit='D'):
     """
     Generate a custom temporal sampling for Satellite Image Time Series.
 
@@ -600,12 +2300,14 @@ def generate_temporal_sampling(start_date, last_date, day_interval=5, save_csv=F
     last_date : int, default False.
         If specified, format (YYYYMMDD).        
     day_interval : int, default 5
-        Integer, days delta to between each date.
+        Integer, days delta to between each date (or months delta if unit is 'M').
     save_csv : False or str.
         If str, path to save the csv.
     fmt : str, default '%Y%m%d'
         Format type of the input dates. 
         Default: '%Y%m%d' (e.g. 20181230)
+    unit : str, default 'D'
+        'D' to generate a date every day_interval days, 'M' every day_interval months.
 
     Example
     -------
@@ -621,23 +2323,444 @@ def generate_temporal_sampling(start_date, last_date, day_interval=5, save_csv=F
     >>> np.loadtxt('/tmp/AcquisitionDates.csv',dtype=int)
     array([20181203, 20181218, 20190102, 20190117, 20190201, 20190216,
        20190303, 20190318, 20190402])
+    >>> generate_temporal_sampling(20180115,20180601,day_interval=1,unit='M')
+    array([20180115, 20180215, 20180315, 20180415, 20180515, 20180615])
     """
-    if isinstance(start_date, int):
-        start_date = str(start_date)
-    if isinstance(last_date, int):
-        last_date = str(last_date)
+    custom_acquisition_dates = TimeAxis.arange(
+        start_date, last_date, step=day_interval, unit=unit, fmt=fmt).to_yyyymmdd()
 
-    start_date = dt.datetime.strptime(start_date, fmt)
-    last_date = dt.datetime.strptime(last_date, fmt)
+    if save_csv:
+        np.savetxt(save_csv, custom_acquisition_dates, fmt='%d')
+    else:
+        return custom_acquisition_dates
 
-    custom_acquisition_dates = [start_date.strftime('%Y%m%d')]
-    newDate = start_date
-    while newDate < last_date:
-        newDate = newDate + dt.timedelta(day_interval)
-        custom_acquisition_dates.append(newDate.strftime('%Y%m%d'))
 
-    if save_csv:
-        np.savetxt(save_csv, np.asarray(
-            custom_acquisition_dates, dtype=np.int), fmt='%d')
+def _compute_phenology_block(X, sensor, expression, smooth_signal, smoother, smoother_params,
+                             metrics_params):
+    """
+    Index, smoothing and phenology metrics of one block.
+    """
+    X_index = sensor.generate_index(X, expression)
+    X_smooth = getattr(smooth_signal, smoother)(X_index, **smoother_params)
+    # release the index before computing the metrics
+    del X_index
+    feats = smooth_signal.get_phenology_metrics(X_smooth, **metrics_params)
+    del X_smooth
+
+    return feats
+
+
+def generate_phenology_raster(input_raster, output_raster, sensor, dates, index='NDVI', output_dates=False,
+                              smoother='savitzski_golay', smoother_params={}, metrics=['sos', 'eos', 'los'],
+                              sos=0.2, eos=0.8, min_from_year=False, fractional=True, date_format='doy',
+                              n_jobs=1, dtype=np.float32, fmt='%Y%m%d', deduplicate=False):
+    """
+    Generate a phenology metrics raster from a raster time series in one pass.
+
+    For each block, the index is computed, smoothed and its phenology metrics are extracted
+    in memory. Only the metrics are written, one band per metric.
+
+    Parameters
+    -----------
+    input_raster : path
+        path of the raster time series.
+    output_raster : path
+        path to save the raster file. (e.g. '/tmp/phenology.tif')
+    sensor : object
+        Sensor from :mod:`museopheno.sensors` (e.g. :class:`museopheno.sensors.Sentinel2`).
+    dates : list
+        list of dates of the raster. E.g. [20180429, 20180513]
+    index : str or dict, default 'NDVI'
+        Name of an index of the sensor, or expression (see :func:`museopheno.sensors.SensorManager.generate_index`).
+    output_dates : list or False, default False
+        Dates of the smoothed time series (e.g. from :func:`generate_temporal_sampling`).
+        If False, same as dates.
+    smoother : str, default 'savitzski_golay'
+        Name of the :class:`SmoothSignal` method used to smooth the index.
+    smoother_params : dict, default {}
+        Parameters of the smoother (e.g. dict(window_length=9, polyorder=2)).
+    metrics : list, default ['sos', 'eos', 'los']
+        Metrics to write, see :func:`get_phenology_metrics`.
+    sos : float, default 0.2
+        Percentage (0.2 for 20%) of the season amplitude
+    eos : float, default 0.8
+        Percentage (0.8 for 80%) of the season amplitude
+    min_from_year : bool, default False
+        If True, metrics thresolds will be computed using the min from the year
+    fractional : bool, default True
+        If True, SOS and EOS are interpolated between two output dates.
+    date_format : str, default 'doy'
+        Format of sos, eos and peak_date, see :func:`SmoothSignal.get_phenology_metrics`.
+    n_jobs : int, default 1
+        Number of blocks processed at the same time. -1 to use every core.
+    dtype : numpy dtype, default np.float32
+        dtype of the output
+    fmt : str, default '%Y%m%d'
+        Format of dates.
+    deduplicate : bool, default False
+        If True, identical pixels of a block are smoothed only once (see :class:`SmoothSignal`).
+
+    Example
+    --------
+    >>> from museopheno import sensors, datasets
+    >>> raster, dates = datasets.Sentinel2_3a_2018(return_dates=True)
+    >>> sensor = sensors.Sentinel2(n_bands=10)
+    >>> dates_5days = generate_temporal_sampling(dates[0], dates[-1], 5)
+    >>> generate_phenology_raster(raster, '/tmp/phenology.tif', sensor, dates, index='NDVI',
+    ...                           output_dates=dates_5days, smoother_params=dict(window_length=9, polyorder=2))
+    """
+    import gdal
+    from museotoolbox.processing import RasterMath
+
+    if isinstance(index, str):
+        expression = sensor.get_index_expression(index)
     else:
-        return np.asarray(custom_acquisition_dates, dtype=np.int)
+        expression = index
+
+    smooth_signal = SmoothSignal(dates, output_dates=output_dates, fmt=fmt, deduplicate=deduplicate)
+    metrics_params = dict(sos=sos, eos=eos, min_from_year=min_from_year, metrics=metrics,
+                          fractional=fractional, date_format=date_format)
+
+    rM = RasterMath(input_raster, n_jobs=n_jobs, message='Computing phenology metrics')
+    rM.add_function(
+        _compute_phenology_block,
+        output_raster,
+        out_n_bands=len(metrics),
+        out_np_dt=dtype,
+        sensor=sensor,
+        expression=expression,
+        smooth_signal=smooth_signal,
+        smoother=smoother,
+        smoother_params=smoother_params,
+        metrics_params=metrics_params)
+    rM.run()
+
+    ds = gdal.Open(output_raster, gdal.GA_Update)
+    for idx, metric in enumerate(metrics):
+        ds.GetRasterBand(idx+1).SetDescription(metric)
+    ds.FlushCache()
+    ds = None
+
+
+def _accumulate_zonal(X, ids, n_labels, sums, counts, hist=None, ranges=None):
+    """
+    Add the values of a block to the per-label, per-date sums and counts.
+
+    X : array (n_pixels, n_dates), nan for nodata
+    ids : array (n_pixels,), position of the label of each pixel, -1 to skip the pixel
+    hist : array (n_labels, n_dates, n_bins) or None, histogram of each label and date
+    ranges : array (n_dates, 2), minimum and maximum of the histograms of each date
+    """
+    n_dates = X.shape[1]
+    valid = np.isfinite(X) & (ids >= 0)[:, np.newaxis]
+    cells = (ids[:, np.newaxis] * n_dates + np.arange(n_dates))[valid]
+    values = X[valid]
+
+    size = n_labels * n_dates
+    sums += np.bincount(cells, weights=values, minlength=size).reshape(n_labels, n_dates)
+    counts += np.bincount(cells, minlength=size).reshape(n_labels, n_dates)
+
+    if hist is not None:
+        n_bins = hist.shape[-1]
+        dates = np.broadcast_to(np.arange(n_dates), X.shape)[valid]
+        lower = ranges[dates, 0]
+        width = (ranges[dates, 1] - lower) / n_bins
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bin_idx = np.floor((values - lower) / width)
+        bin_idx = np.clip(np.nan_to_num(bin_idx), 0, n_bins - 1).astype(np.int64)
+        hist += np.bincount(cells * n_bins + bin_idx, minlength=size * n_bins).reshape(hist.shape)
+
+
+def _histogram_quantiles(hist, ranges, quantiles):
+    """
+    Quantiles of each label and date from their histogram, linearly interpolated within the bin.
+
+    Return array (n_labels, n_quantiles, n_dates), nan where the label has no value.
+    """
+    n_bins = hist.shape[-1]
+    cumulative = np.cumsum(hist, axis=-1)
+    total = cumulative[..., -1:]
+    width = (ranges[:, 1] - ranges[:, 0]) / n_bins
+
+    result = np.full((hist.shape[0], len(quantiles), hist.shape[1]), np.nan)
+    for q_idx, q in enumerate(quantiles):
+        target = q * total
+        # first bin where the cumulative count reaches the quantile
+        bin_idx = np.argmax(cumulative >= target, axis=-1)
+        before = np.take_along_axis(cumulative, bin_idx[..., np.newaxis], axis=-1)[..., 0] - \
+            np.take_along_axis(hist, bin_idx[..., np.newaxis], axis=-1)[..., 0]
+        in_bin = np.take_along_axis(hist, bin_idx[..., np.newaxis], axis=-1)[..., 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(in_bin > 0, (target[..., 0] - before) / in_bin, 0)
+        values = ranges[:, 0] + (bin_idx + fraction) * width
+        values[total[..., 0] == 0] = np.nan
+        result[:, q_idx, :] = values
+
+    return result
+
+
+def zonal_time_series(input_raster, label_raster, quantiles=False, n_bins=100, label_nodata=0, block_rows=256):
+    """
+    Aggregate a raster time series per label (e.g. per agricultural parcel).
+
+    Both rasters are read by blocks of rows. For each label and each date, the sum and the
+    number of valid values are accumulated, so the per-label series can then be smoothed
+    with :class:`SmoothSignal` and its phenology computed on much fewer lines than pixels.
+
+    Parameters
+    -----------
+    input_raster : path
+        path of the raster time series. Its nodata value (and nan) are ignored.
+    label_raster : path
+        path of the label raster (one band of integers), aligned with input_raster.
+    quantiles : list or False, default False
+        Quantiles to compute, e.g. [0.25, 0.5, 0.75]. They are estimated from an histogram
+        of n_bins bins per label and date, between the minimum and the maximum of each date,
+        which needs one more reading of input_raster.
+    n_bins : int, default 100
+        Number of bins of the histograms used for the quantiles.
+    label_nodata : int or False, default 0
+        Label of pixels to ignore. False to keep every label.
+    block_rows : int, default 256
+        Number of rows read at once.
+
+    Returns
+    --------
+    labels : array
+        Sorted labels, of shape (n_labels,).
+    mean : array
+        Mean of each label and date, of shape (n_labels, n_dates), nan where there is no valid value.
+    counts : array
+        Number of valid values of each label and date, of shape (n_labels, n_dates).
+    quantiles : array
+        Only if quantiles, array of shape (n_labels, n_quantiles, n_dates).
+
+    Example
+    --------
+    >>> labels, mean, counts = zonal_time_series(raster, '/tmp/parcels.tif')
+    >>> ts = SmoothSignal(dates, output_dates=dates_5days)
+    >>> ts.get_phenology_metrics(ts.savitzski_golay(mean, window_length=9, polyorder=2))
+    """
+    import gdal
+
+    ds = gdal.Open(input_raster)
+    ds_label = gdal.Open(label_raster)
+    if (ds.RasterXSize, ds.RasterYSize) != (ds_label.RasterXSize, ds_label.RasterYSize):
+        raise ValueError('input_raster and label_raster must have the same size.')
+    n_cols, n_rows, n_dates = ds.RasterXSize, ds.RasterYSize, ds.RasterCount
+    nodata = ds.GetRasterBand(1).GetNoDataValue()
+    band_label = ds_label.GetRasterBand(1)
+
+    def read_blocks(read_data=True):
+        for row in range(0, n_rows, block_rows):
+            n_block_rows = min(block_rows, n_rows - row)
+            labels_block = band_label.ReadAsArray(0, row, n_cols, n_block_rows).ravel()
+            if read_data is False:
+                yield labels_block, None
+                continue
+            X = ds.ReadAsArray(0, row, n_cols, n_block_rows).reshape(n_dates, -1).T.astype(np.float64)
+            if nodata is not None:
+                X[X == nodata] = np.nan
+            yield labels_block, X
+
+    # first reading : labels (and range of each date for the histograms)
+    labels = np.empty(0, dtype=np.int64)
+    if quantiles:
+        ranges = np.tile([np.inf, -np.inf], (n_dates, 1))
+    for labels_block, X in read_blocks(read_data=bool(quantiles)):
+        labels = np.union1d(labels, np.unique(labels_block))
+        if quantiles:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                ranges[:, 0] = np.fmin(ranges[:, 0], np.nanmin(X, axis=0))
+                ranges[:, 1] = np.fmax(ranges[:, 1], np.nanmax(X, axis=0))
+    if label_nodata is not False:
+        labels = labels[labels != label_nodata]
+
+    n_labels = labels.size
+    if n_labels == 0:
+        # only label_nodata in label_raster
+        empty = (labels, np.empty((0, n_dates)), np.zeros((0, n_dates), dtype=np.int64))
+        if quantiles:
+            return empty + (np.empty((0, len(quantiles), n_dates)),)
+        return empty
+    sums = np.zeros((n_labels, n_dates))
+    counts = np.zeros((n_labels, n_dates), dtype=np.int64)
+    hist = np.zeros((n_labels, n_dates, n_bins), dtype=np.int64) if quantiles else None
+
+    for labels_block, X in read_blocks():
+        ids = np.searchsorted(labels, labels_block)
+        ids[ids == n_labels] = 0
+        ids[labels[ids] != labels_block] = -1
+        _accumulate_zonal(X, ids, n_labels, sums, counts, hist, ranges if quantiles else None)
+        del X
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = sums / counts
+
+    if quantiles:
+        return labels, mean, counts, _histogram_quantiles(hist, ranges, quantiles)
+    return labels, mean, counts
+
+
+def _compute_coefficients_block(X, smooth_signal, model, params):
+    """
+    Coefficients of the model fitted on each pixel of one block.
+    """
+    if model == 'harmonic':
+        return smooth_signal.harmonic(X, return_coefficients=True, **params)
+    return smooth_signal.fit_model(X, model=model, return_params=True, **params)[1]
+
+
+def evaluate_coefficients(coefficients, dates_int, model='harmonic', period=365, n_bands=1, order_by='date'):
+    """
+    Evaluate the series described by coefficients at dates_int.
+
+    Parameters
+    -----------
+    coefficients : array
+        Coefficients of shape (n_pixels, n_coefficients), e.g. from :func:`SmoothSignal.harmonic`
+        with return_coefficients=True or from :func:`SmoothSignal.fit_model` with return_params=True.
+    dates_int : array
+        Dates as the number of days since the first date of the fitted time series.
+    model : str, default 'harmonic'
+        'harmonic' or a model of :func:`SmoothSignal.fit_model`.
+    period : int or float, default 365
+        Base period in days of the harmonics.
+    n_bands : int, default 1
+        Number of bands whose coefficients follow each other (harmonic only).
+    order_by : str, default 'date'
+        Order of the output columns when there are several bands : 'date' (all bands of the first date, then
+        of the second date...) or 'band' (all dates of the first band, then of the second band...).
+
+    Returns
+    --------
+    Array of shape (n_pixels, n_bands*n_dates).
+    """
+    coefficients = np.atleast_2d(np.asarray(coefficients, dtype=np.float64))
+    dates_int = np.asarray(dates_int, dtype=np.float64)
+    if model != 'harmonic':
+        return fun_models.get_model(model)['kernel'](coefficients, dates_int, jacobian=False)[0]
+
+    values = []
+    for band_coefs in np.split(coefficients, n_bands, axis=1):
+        n_harmonics = (band_coefs.shape[1] - 1) // 2
+        amplitude = band_coefs[:, 1:n_harmonics + 1]
+        phase = band_coefs[:, n_harmonics + 1:]
+        omega = 2 * np.pi * dates_int / period * np.arange(1, n_harmonics + 1)[:, np.newaxis]
+        # amplitude * cos(omega - phase) = cos and sin terms of the regression
+        values.append(band_coefs[:, :1] + (amplitude * np.cos(phase)) @ np.cos(omega) +
+                      (amplitude * np.sin(phase)) @ np.sin(omega))
+
+    if order_by == 'date':
+        return np.stack(values, axis=-1).reshape(coefficients.shape[0], -1)
+    return np.hstack(values)
+
+
+# numpy dtype name -> GDAL data type name
+GDAL_DTYPES = dict(
+    uint8='Byte', int8='Int8', uint16='UInt16', int16='Int16', uint32='UInt32', int32='Int32',
+    float32='Float32', float64='Float64')
+
+
+class CoefficientsRaster:
+    """
+    Read a raster of coefficients (see :func:`SmoothSignal.generate_coefficients_raster`)
+    and evaluate its series at any dates, block per block.
+
+    Parameters
+    -----------
+    coefficients_raster : path
+        path of the coefficients raster.
+
+    Example
+    --------
+    >>> coefs = CoefficientsRaster('/tmp/coefs.tif')
+    >>> for row, X in coefs.iter_blocks([20180601, 20180615]):
+    ...     print(row, X.shape)
+    """
+    def __init__(self, coefficients_raster):
+        import gdal
+
+        self.coefficients_raster = coefficients_raster
+        ds = gdal.Open(coefficients_raster)
+        metadata = ds.GetMetadata('COEFFICIENTS')
+        if 'model' not in metadata:
+            raise ValueError('{} has no coefficients metadata.'.format(coefficients_raster))
+
+        self.model = metadata['model']
+        self.n_bands = int(metadata.get('n_bands', 1))
+        self.period = float(metadata.get('period', 365))
+        self.order_by = metadata.get('order_by', 'date')
+        self.day0 = np.datetime64(metadata['day0'], 'D')
+        self.output_dates = [int(date) for date in metadata['output_dates'].split(',')]
+        self.n_cols, self.n_rows, self.n_coefficients = ds.RasterXSize, ds.RasterYSize, ds.RasterCount
+        ds = None
+
+    def _get_dates_int(self, dates, fmt='%Y%m%d'):
+        if dates is False:
+            dates = self.output_dates
+        return TimeAxis(dates, fmt=fmt).to_int(self.day0)
+
+    def read(self, dates=False, xoff=0, yoff=0, xsize=None, ysize=None, fmt='%Y%m%d'):
+        """
+        Evaluate the series of a window of the raster.
+
+        Parameters
+        -----------
+        dates : list or False, default False
+            Dates to evaluate. If False, output dates of the smoothing.
+        xoff, yoff, xsize, ysize : int
+            Window to read, the whole raster by default.
+        fmt : str, default '%Y%m%d'
+            Format of dates.
+
+        Returns
+        --------
+        Array of shape (n_pixels, n_bands*n_dates), pixels line after line, bands ordered as the smoothed raster.
+        """
+        import gdal
+
+        xsize = self.n_cols - xoff if xsize is None else xsize
+        ysize = self.n_rows - yoff if ysize is None else ysize
+        ds = gdal.Open(self.coefficients_raster)
+        coefficients = ds.ReadAsArray(xoff, yoff, xsize, ysize).reshape(self.n_coefficients, -1).T
+        ds = None
+
+        return evaluate_coefficients(
+            coefficients, self._get_dates_int(dates, fmt), self.model, self.period, self.n_bands, self.order_by)
+
+    def iter_blocks(self, dates=False, block_rows=256, fmt='%Y%m%d'):
+        """
+        Yield the first row of each block of rows and its evaluated series
+        (see :func:`read`), so only one block is in memory at once.
+        """
+        for row in range(0, self.n_rows, block_rows):
+            yield row, self.read(dates, 0, row, self.n_cols, min(block_rows, self.n_rows - row), fmt)
+
+    def generate_raster(self, output_raster, dates=False, dtype=np.float32, block_rows=256, fmt='%Y%m%d'):
+        """
+        Write the series evaluated at dates in a new raster, block per block.
+        """
+        import gdal
+
+        dates_int = self._get_dates_int(dates, fmt)
+        n_bands = self.n_bands * dates_int.size
+
+        ds = gdal.Open(self.coefficients_raster)
+        driver = gdal.GetDriverByName('GTiff')
+        if np.dtype(dtype).name not in GDAL_DTYPES:
+            raise ValueError('dtype must be one of {}.'.format(', '.join(GDAL_DTYPES)))
+        gdal_dtype = gdal.GetDataTypeByName(GDAL_DTYPES[np.dtype(dtype).name])
+        out = driver.Create(output_raster, self.n_cols, self.n_rows, n_bands, gdal_dtype)
+        out.SetGeoTransform(ds.GetGeoTransform())
+        out.SetProjection(ds.GetProjection())
+        ds = None
+
+        for row, X in self.iter_blocks(dates, block_rows, fmt):
+            block = X.T.reshape(n_bands, -1, self.n_cols).astype(dtype)
+            for band in range(n_bands):
+                out.GetRasterBand(band + 1).WriteArray(block[band], 0, row)
+            del X, block
+        out.FlushCache()
+        out = None
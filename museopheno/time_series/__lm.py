@@ -0,0 +1,114 @@
+import time
+
+import numpy as np
+
+
+def _solve_batch(H, g):
+    """
+    Solve H x = g for a stack of small systems. Each system is solved on its own :
+    with a pseudo-inverse when it is singular or ill-conditioned, so the solution of
+    a sample does not depend on the other samples of the stack. Non-finite systems give nan.
+    """
+    x = np.full(g.shape, np.nan)
+    finite = np.logical_and(np.isfinite(H).all(axis=(1, 2)), np.isfinite(g).all(axis=1))
+    well_conditioned = np.zeros(finite.shape, dtype=bool)
+    well_conditioned[finite] = np.linalg.cond(H[finite]) < 1 / np.finfo(H.dtype).eps
+    x[well_conditioned] = np.linalg.solve(H[well_conditioned], g[well_conditioned, :, np.newaxis])[..., 0]
+    singular = np.logical_and(finite, ~well_conditioned)
+    x[singular] = np.einsum('ijk,ik->ij', np.linalg.pinv(H[singular]), g[singular])
+    return x
+
+
+def levenberg_marquardt(kernel, params, time_samples, samples, maxiter=100,
+                        ftol=1e-10, gtol=1e-10, damping=1e-3,
+                        deadline=None, iteration_budget=None):
+    """
+    Fit a model on every sample at once with a batched Levenberg-Marquardt
+    (one damping parameter per sample).
+
+    kernel : function kernel(params, t, samples=None, jacobian=True) returning
+        the value, the residual and the Jacobian (n_samples, n_params, n_time_samples)
+        of the model, e.g. double_logistique_fused of __dl
+    params : array (n_params,) or (n_samples, n_params), initial parameters
+    time_samples : time samples
+    samples : array (n_samples, n_time_samples)
+    deadline : time.time() after which the remaining samples stop (not converged)
+    iteration_budget : total number of iterations over all the samples after
+        which the remaining samples stop (not converged)
+
+    Return the fitted parameters (n_samples, n_params), the number of iterations and
+    the convergence flag of each sample.
+
+    Each sample is fitted on its own : fitting samples gives the same result as stacking
+    the fits of samples[i:i+1], whatever the chunks, processes or deduplication used.
+
+    >>> fitted = levenberg_marquardt(kernel, params, t, samples)[0]
+    >>> one_by_one = np.vstack([levenberg_marquardt(kernel, params[i:i+1], t, samples[i:i+1])[0]
+    ...                         for i in range(samples.shape[0])])
+    >>> np.array_equal(fitted, one_by_one, equal_nan=True)
+    True
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    t = np.asarray(time_samples, dtype=np.float64)
+    n_samples, n_t = samples.shape
+
+    params = np.array(np.broadcast_to(params, (n_samples, np.shape(params)[-1])), dtype=np.float64)
+    n_params = params.shape[1]
+    damping = np.full(n_samples, damping, dtype=np.float64)
+    n_iter = np.zeros(n_samples, dtype=np.int64)
+    converged = np.zeros(n_samples, dtype=bool)
+
+    _, residual, _ = kernel(params, t, samples, jacobian=False)
+    cost = (residual**2).mean(axis=1)
+
+    active = np.flatnonzero(np.isfinite(cost))
+    for _ in range(maxiter):
+        if active.size == 0:
+            break
+        if deadline is not None and time.time() > deadline:
+            break
+        if iteration_budget is not None:
+            if n_iter.sum() >= iteration_budget:
+                break
+            # the last iteration only steps the first samples, so the budget is never exceeded
+            active = active[:int(iteration_budget - n_iter.sum())]
+            if active.size == 0:
+                break
+
+        _, _, df = kernel(params[active], t)
+        grad = np.einsum('ijk,ik->ij', df, residual[active])
+        hessian = np.einsum('ijk,ilk->ijl', df, df)
+
+        # stop where the gradient of the cost is already flat
+        flat = np.abs(2 * grad / n_t).max(axis=1) <= gtol
+        converged[active[flat]] = True
+        active, grad, hessian = active[~flat], grad[~flat], hessian[~flat]
+        if active.size == 0:
+            break
+
+        diag = np.einsum('ijj->ij', hessian) + 1e-12
+        hessian[:, np.arange(n_params), np.arange(n_params)] += damping[active, np.newaxis] * diag
+        new_params = params[active] + _solve_batch(hessian, -grad)
+
+        _, new_residual, _ = kernel(new_params, t, samples[active], jacobian=False)
+        new_cost = (new_residual**2).mean(axis=1)
+
+        n_iter[active] += 1
+        accept = new_cost < cost[active]
+        gain = cost[active] - new_cost
+
+        accepted = active[accept]
+        params[accepted] = new_params[accept]
+        residual[accepted] = new_residual[accept]
+        cost[accepted] = new_cost[accept]
+        damping[accepted] /= 10
+        damping[active[~accept]] *= 10
+
+        # converged when the cost does not decrease anymore
+        done = np.logical_or(
+            np.logical_and(accept, gain <= ftol * np.maximum(cost[active], 1e-300)),
+            damping[active] > 1e12)
+        converged[active[done]] = True
+        active = active[~done]
+
+    return params, n_iter, converged
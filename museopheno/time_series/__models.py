@@ -0,0 +1,175 @@
+import numpy as np
+
+from museopheno.time_series import __dl as fun_dl
+from museopheno.time_series import __lm as fun_lm
+
+
+# Each kernel follows the signature of fun_dl.double_logistique_fused :
+# kernel(params, t, samples=None, jacobian=True, dtype=None) -> (f, residual, df)
+# with params (n_samples, n_params) and df (n_samples, n_params, n_time_samples).
+
+
+def _prepare(params, t, dtype):
+    if dtype is None:
+        dtype = np.result_type(params, t, np.float32)
+    params = np.asarray(params, dtype=dtype)
+    t = np.asarray(t, dtype=dtype)
+    return params, t, dtype
+
+
+def logistic_fused(params, t, samples=None, jacobian=True, dtype=None):
+    """
+    Single logistic f = A/(1+exp((x0-t)/x1)) + B (green-up only).
+
+    params[:, 0] : A
+    params[:, 1] : B
+    params[:, 2] : x0
+    params[:, 3] : x1
+    """
+    params, t, dtype = _prepare(params, t, dtype)
+    A, B, x0, x1 = [params[:, [i]] for i in range(4)]
+
+    f1 = fun_dl._logistic(x0, x1, t, dtype)
+    f = A*f1 + B
+
+    residual = None if samples is None else f - samples
+
+    df = None
+    if jacobian:
+        g1 = f1 * (1 - f1)
+        df = np.empty((params.shape[0], 4, t.size), dtype=dtype)
+        df[:, 0, :] = f1
+        df[:, 1, :] = 1
+        df[:, 2, :] = -A / x1 * g1
+        df[:, 3, :] = A * (x0-t) / x1**2 * g1
+
+    return f, residual, df
+
+
+def asymmetric_gaussian_fused(params, t, samples=None, jacobian=True, dtype=None):
+    """
+    Asymmetric gaussian f = A*exp(-((t-x0)/w)**2) + B, with w = x1 before
+    the peak x0 and w = x2 after it (TIMESAT function with a shape exponent of 2).
+
+    params[:, 0] : A
+    params[:, 1] : B
+    params[:, 2] : x0
+    params[:, 3] : x1
+    params[:, 4] : x2
+    """
+    params, t, dtype = _prepare(params, t, dtype)
+    A, B, x0, x1, x2 = [params[:, [i]] for i in range(5)]
+
+    before = t < x0
+    width = np.where(before, x1, x2)
+    distance = (t - x0) / width
+    g = np.exp(-distance**2)
+    f = A*g + B
+
+    residual = None if samples is None else f - samples
+
+    df = None
+    if jacobian:
+        # derivative of the gaussian w.r.t. its width
+        g_width = A * g * 2 * distance**2 / width
+        df = np.empty((params.shape[0], 5, t.size), dtype=dtype)
+        df[:, 0, :] = g
+        df[:, 1, :] = 1
+        df[:, 2, :] = A * g * 2 * distance / width
+        df[:, 3, :] = np.where(before, g_width, 0)
+        df[:, 4, :] = np.where(before, 0, g_width)
+
+    return f, residual, df
+
+
+def elmore_fused(params, t, samples=None, jacobian=True, dtype=None):
+    """
+    Double logistic of Elmore et al. (2012) with a linear decrease of the summer plateau
+    f = m1 + (m2 - m7*t) * (1/(1+exp((m3-t)/m4)) - 1/(1+exp((m5-t)/m6))).
+
+    params[:, 0:7] : m1 to m7
+    """
+    params, t, dtype = _prepare(params, t, dtype)
+    m1, m2, m3, m4, m5, m6, m7 = [params[:, [i]] for i in range(7)]
+
+    f1 = fun_dl._logistic(m3, m4, t, dtype)
+    f2 = fun_dl._logistic(m5, m6, t, dtype)
+    season = f1 - f2
+    plateau = m2 - m7*t
+    f = m1 + plateau*season
+
+    residual = None if samples is None else f - samples
+
+    df = None
+    if jacobian:
+        g1 = f1 * (1 - f1)
+        g2 = f2 * (1 - f2)
+        df = np.empty((params.shape[0], 7, t.size), dtype=dtype)
+        df[:, 0, :] = 1
+        df[:, 1, :] = season
+        df[:, 2, :] = -plateau / m4 * g1
+        df[:, 3, :] = plateau * (m3-t) / m4**2 * g1
+        df[:, 4, :] = plateau / m6 * g2
+        df[:, 5, :] = -plateau * (m5-t) / m6**2 * g2
+        df[:, 6, :] = -t * season
+
+    return f, residual, df
+
+
+def logistic_initial_parameters(time_samples, samples):
+    A, B, x0, x1, _, _ = fun_dl.initial_parameters(time_samples, samples).T
+    return np.column_stack((A, B, x0, x1))
+
+
+def asymmetric_gaussian_initial_parameters(time_samples, samples):
+    t = np.asarray(time_samples, dtype=np.float64)
+    A, B, x0, x1, x2, x3 = fun_dl.initial_parameters(time_samples, samples).T
+    t_peak = t[np.asarray(samples).argmax(axis=1)]
+    min_width = np.median(np.diff(t)) / 2 if t.size > 1 else 1.
+    # half of the amplitude is reached at sqrt(ln(2)) width from the peak
+    left = np.maximum(t_peak - x0, min_width) / np.sqrt(np.log(2))
+    right = np.maximum(x2 - t_peak, min_width) / np.sqrt(np.log(2))
+    return np.column_stack((A, B, t_peak, left, right))
+
+
+def elmore_initial_parameters(time_samples, samples):
+    params = fun_dl.initial_parameters(time_samples, samples)
+    return np.column_stack((params[:, [1, 0, 2, 3, 4, 5]], np.zeros(params.shape[0])))
+
+
+# The double logistic of phenotb is the model of Beck et al. (2006),
+# with slopes given as time scales (x1 = 1/mS, x3 = 1/mA).
+MODELS = {
+    'logistic': dict(
+        params=['A', 'B', 'x0', 'x1'],
+        kernel=logistic_fused,
+        initial_parameters=logistic_initial_parameters),
+    'double_logistic': dict(
+        params=['A', 'B', 'x0', 'x1', 'x2', 'x3'],
+        kernel=fun_dl.double_logistique_fused,
+        initial_parameters=fun_dl.initial_parameters),
+    'asymmetric_gaussian': dict(
+        params=['A', 'B', 'x0', 'x1', 'x2'],
+        kernel=asymmetric_gaussian_fused,
+        initial_parameters=asymmetric_gaussian_initial_parameters),
+    'elmore': dict(
+        params=['m1', 'm2', 'm3', 'm4', 'm5', 'm6', 'm7'],
+        kernel=elmore_fused,
+        initial_parameters=elmore_initial_parameters)}
+
+
+def get_model(model):
+    if model not in MODELS:
+        raise ValueError('{} is not an available model. Please select one of them : {}'.format(
+            model, ', '.join(MODELS)))
+    return MODELS[model]
+
+
+def fit(model, params, time_samples, samples, **lm_params):
+    """
+    Fit model on every sample at once with the batched Levenberg-Marquardt.
+
+    Return the fitted parameters (n_samples, n_params), the number of iterations and
+    the convergence flag of each sample.
+    """
+    return fun_lm.levenberg_marquardt(get_model(model)['kernel'], params, time_samples, samples, **lm_params)